@@ -1,10 +1,34 @@
 import re
-import urllib.error
+import html
+import json
+import requests
+import threading
 
 from bs4 import BeautifulSoup
 from datetime import datetime
 from urllib.parse import quote
-from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+import utils
+import webcache
+
+#Shared by every request, replace with a disk-backed CachedSession to keep responses between runs
+session = webcache.CachedSession()
+
+search_url = 'https://bandcamp.com/search?q='
+
+#Search results change more often than album pages
+search_ttl = 60 * 60
+
+search_executor = ThreadPoolExecutor(max_workers=4)
+
+ld_json = re.compile(r'<script type="application/ld\+json"[^>]*>(.*?)</script>', re.DOTALL)
+tralbum_json = re.compile(r'data-tralbum="([^"]*)"')
+result_heading = re.compile(r'<div class="heading">\s*<a[^>]*>(.*?)</a>', re.DOTALL)
+result_subhead = re.compile(r'<div class="subhead">(.*?)</div>', re.DOTALL)
+result_itemurl = re.compile(r'<div class="itemurl">\s*<a[^>]*>(.*?)</a>', re.DOTALL)
+name_your_price = re.compile(r'class="buyItemExtra buyItemNyp secondaryText"[^>]*>\s*name your price')
 
 def calc_length(tracks):
     length = 0
@@ -21,44 +45,123 @@ def calc_length(tracks):
         return f'{h:d}:{m:02d}:{s:02d}'
     return f'{m:02d}:{s:02d}'
 
-def parse_results(query, album_name, artist_name):
-    soup = BeautifulSoup(urlopen(query).read(), 'html.parser')
+def format_length(seconds):
+    m, s = divmod(int(seconds), 60)
+    if m >= 60:
+        h, m = divmod(m, 60)
+        return f'{h:d}:{m:02d}:{s:02d}'
+    return f'{m:02d}:{s:02d}'
+
+def parse_duration(duration):
+    '''
+    Returns the seconds in an ld+json duration such as "P00H03M25S".
+    '''
+    match = re.match(r'P(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?$', duration)
+    h, m, s = (float(value or 0) for value in match.groups())
+    return 60 * 60 * h + 60 * m + s
 
-    results = soup.find_all("li", {"class":"searchresult album"})
+def text(fragment):
+    return html.unescape(re.sub(r'<[^>]+>', '', fragment)).strip()
 
-    for result in results:
+def strip_by(subhead):
+    subhead = subhead.strip()
+    if subhead.startswith("by "):
+        subhead = subhead[3:]
+    return subhead.strip()
+
+def soup_results(page):
+    '''
+    Returns the (album, artist, url) of each album in a search results page by walking the full HTML tree.
+    '''
+    soup = BeautifulSoup(page, 'html.parser')
+
+    results = []
+    for result in soup.find_all("li", {"class":"searchresult album"}):
         info = result.find("div", {"class":"result-info"})
         heading = info.find("div", {"class":"heading"}).find("a").contents[0]
         subhead = info.find("div", {"class":"subhead"}).contents[0]
         itemurl = info.find("div", {"class":"itemurl"}).find("a").contents[0]
+        results.append((heading.strip(), strip_by(subhead), itemurl.strip()))
+
+    return results
+
+def extract_results(page):
+    '''
+    Returns the (album, artist, url) of each album in a search results page using regular expressions,
+    or None if the page doesn't look as expected.
+    '''
+    page = page.decode('utf-8', 'replace') if isinstance(page, bytes) else page
+
+    results = []
+    blocks = re.findall(r'<li class="searchresult album"(.*?)</li>', page, re.DOTALL)
+    for block in blocks:
+        heading = result_heading.search(block)
+        subhead = result_subhead.search(block)
+        itemurl = result_itemurl.search(block)
+        if not heading or not subhead or not itemurl:
+            return None
+        results.append((text(heading.group(1)), strip_by(text(subhead.group(1))), text(itemurl.group(1))))
 
-        album = heading.strip()
-        artist = subhead.strip().lstrip("by ")
+    if not blocks and 'searchresult album' in page:
+        return None
+    return results
 
-        if album == album_name and artist == artist_name:
+def parse_results(query, album_name, artist_name, found=None):
+    '''
+    Returns the URL of the exact match for album_name and artist_name in a search, or None.
+    Gives up early once found, a threading.Event shared with the other queries, is set.
+    '''
+    if found and found.is_set():
+        return None
+    with metrics.timer("request_seconds", {"url": query}, service="bandcamp", kind="search", cache="miss") as labels:
+        page, labels['cache'] = session.fetch(query, ttl=search_ttl)
+    if labels['cache'] == "miss":
+        metrics.count("response_bytes_total", len(page), service="bandcamp")
+    if found and found.is_set():
+        return None
+    results = extract_results(page)
+    if results is None:
+        results = soup_results(page)
+
+    album_name = utils.normalize(album_name)
+    artist_name = utils.normalize(artist_name)
+
+    for album, artist, itemurl in results:
+        if utils.normalize(album) == album_name and utils.normalize(artist) == artist_name:
             return itemurl
 
     return None
 
 def get_album_url(album_name, artist_name):
     query_urls = []
-    query_urls.append('https://bandcamp.com/search?q=' + quote(album_name))
-    query_urls.append('https://bandcamp.com/search?q=' + quote(artist_name))
-    query_urls.append('https://bandcamp.com/search?q=' + quote(album_name) + "%20" + quote(artist_name))
-    query_urls.append('https://bandcamp.com/search?q=' + quote(artist_name) + "%20" + quote(album_name))
-    
-    for query in query_urls:
-        results = parse_results(query, album_name, artist_name)
-        if results:
-            return results
-    
-    return None
+    query_urls.append(search_url + quote(album_name))
+    query_urls.append(search_url + quote(artist_name))
+    query_urls.append(search_url + quote(album_name) + "%20" + quote(artist_name))
+    query_urls.append(search_url + quote(artist_name) + "%20" + quote(album_name))
 
-def get_album_info(url):
+    #Search in parallel, the first exact match stops the remaining queries from fetching or parsing
+    found = threading.Event()
+    futures = [search_executor.submit(parse_results, query, album_name, artist_name, found) for query in dict.fromkeys(query_urls)]
     try:
-        soup = BeautifulSoup(urlopen(url).read(), 'html.parser')
-    except urllib.error.HTTPError:
-        return False
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except requests.RequestException:
+                continue
+            if results:
+                return results
+    finally:
+        found.set()
+        for future in futures:
+            future.cancel()
+
+    return None
+
+def soup_album(page, url):
+    '''
+    Returns the album info of an album page by walking the full HTML tree.
+    '''
+    soup = BeautifulSoup(page, 'html.parser')
 
     album = soup.find("h2", {"class":"trackTitle"}).contents[0].strip().replace("\u200B", "")
     artist = soup.find("span", {"itemprop":"byArtist"}).find("a").contents[0].replace("\u200B", "")
@@ -87,3 +190,78 @@ def get_album_info(url):
             tags.append(tag_text.strip())
     
     return {"album":album, "artist":artist, "cover_art":cover_art, "length":length, "release_year":release_year, "tracks":tracks, "tags":tags, "url":url}
+
+def extract_album(page, url):
+    '''
+    Returns the album info of an album page from its embedded ld+json and data-tralbum blobs,
+    or None if they are missing or incomplete.
+    '''
+    page = page.decode('utf-8', 'replace') if isinstance(page, bytes) else page
+    try:
+        album_json = None
+        for blob in ld_json.findall(page):
+            data = json.loads(blob)
+            if "MusicAlbum" in str(data.get("@type")):
+                album_json = data
+                break
+        if not album_json:
+            return None
+
+        tralbum = tralbum_json.search(page)
+        tralbum = json.loads(html.unescape(tralbum.group(1))) if tralbum else {}
+
+        album = album_json['name'].strip().replace("\u200B", "")
+        artist = album_json['byArtist']['name'].replace("\u200B", "")
+        cover_art = album_json['image']
+        if isinstance(cover_art, list):
+            cover_art = cover_art[0]
+
+        tracks = []
+        if tralbum.get('trackinfo'):
+            for track in tralbum['trackinfo']:
+                if not track.get('duration'):
+                    continue
+                tracks.append({"name":track['title'].replace("\u200B", ""), "length":format_length(track['duration'])})
+        else:
+            for element in album_json['track']['itemListElement']:
+                track = element['item']
+                if not track.get('duration'):
+                    continue
+                tracks.append({"name":track['name'].replace("\u200B", ""), "length":format_length(parse_duration(track['duration']))})
+
+        release_year = datetime.strptime(album_json['datePublished'], '%d %b %Y %H:%M:%S %Z').year
+
+        keywords = album_json.get('keywords', [])
+        if isinstance(keywords, str):
+            keywords = keywords.split(", ")
+        tags = [tag.strip() for tag in keywords if tag.islower()]
+    except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+        return None
+
+    return {"album":album, "artist":artist, "cover_art":cover_art, "length":calc_length(tracks), "release_year":release_year, "tracks":tracks, "tags":tags, "url":url}
+
+def is_name_your_price(page):
+    '''
+    Returns True if an album page can be downloaded for a price of 0, from data-tralbum or the buy button.
+    '''
+    page = page.decode('utf-8', 'replace') if isinstance(page, bytes) else page
+    tralbum = tralbum_json.search(page)
+    if tralbum:
+        try:
+            tralbum = json.loads(html.unescape(tralbum.group(1)))
+            if 'minimum_price' in tralbum['current']:
+                return tralbum['current']['minimum_price'] == 0 and not tralbum.get('freeDownloadPage')
+        except (KeyError, TypeError, ValueError):
+            pass
+    return bool(name_your_price.search(page))
+
+def get_album_info(url):
+    try:
+        with metrics.timer("request_seconds", {"url": url}, service="bandcamp", kind="album", cache="miss") as labels:
+            page, labels['cache'] = session.fetch(url)
+        if labels['cache'] == "miss":
+            metrics.count("response_bytes_total", len(page), service="bandcamp")
+    except requests.HTTPError:
+        return False
+
+    return extract_album(page, url) or soup_album(page, url)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+# Compares the embedded JSON/regex Bandcamp extractors against the BeautifulSoup parsers on saved pages
+
+import os
+import sys
+import glob
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bandcamp
+
+fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def measure(function, pages, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for page in pages:
+            function(page)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for page in pages:
+        function(page)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return len(pages) * rounds / elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--rounds', help='Number of passes over the fixture pages', type=int, default=20)
+    args = parser.parse_args()
+
+    album_pages = [open(path, 'rb').read() for path in sorted(glob.glob(os.path.join(fixtures, "album*.html")))]
+    search_pages = [open(path, 'rb').read() for path in sorted(glob.glob(os.path.join(fixtures, "search*.html")))]
+
+    for page in album_pages:
+        if bandcamp.extract_album(page, "") != bandcamp.soup_album(page, ""):
+            print("Warning: extractors disagree on an album page")
+    for page in search_pages:
+        if bandcamp.extract_results(page) != bandcamp.soup_results(page):
+            print("Warning: extractors disagree on a search page")
+
+    benchmarks = [
+        ("album (json)", lambda page: bandcamp.extract_album(page, ""), album_pages),
+        ("album (soup)", lambda page: bandcamp.soup_album(page, ""), album_pages),
+        ("search (regex)", bandcamp.extract_results, search_pages),
+        ("search (soup)", bandcamp.soup_results, search_pages),
+    ]
+
+    print(f"{'parser':16} {'pages/s':>10} {'peak KiB':>10}")
+    for name, function, pages in benchmarks:
+        rate, peak = measure(function, pages, args.rounds)
+        print(f"{name:16} {rate:10.1f} {peak / 1024:10.1f}")
+
+if __name__ == "__main__":
+    main()
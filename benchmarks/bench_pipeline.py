@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+# Runs every pipeline stage on synthetic releases against local stand-in servers, and reports per-stage metrics as JSON
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import musicbrainzngs
+
+import bandcamp
+import manifest
+import musicbrainz
+import ptpimg
+import ratelimit
+import redacted
+import transcode
+import utils
+import webcache
+
+from redcamp import allowed_extensions
+
+fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+#Track count, track length in seconds, bit depth and sample rate of each synthetic release
+profiles = {
+    "album": {"tracks": 10, "length": 30, "bits": 16, "rate": 44100},
+    "hires": {"tracks": 6, "length": 30, "bits": 24, "rate": 96000},
+    "mix": {"tracks": 1, "length": 600, "bits": 16, "rate": 44100},
+}
+
+musicbrainz_response = b'''<?xml version="1.0" encoding="UTF-8"?>
+<metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#" xmlns:ns2="http://musicbrainz.org/ns/ext#-2.0">
+<release-list count="1" offset="0"><release id="00000000-0000-0000-0000-000000000000" ns2:score="100">
+<title>Signal Drift EP</title><status>Official</status>
+<artist-credit><name-credit><artist id="00000000-0000-0000-0000-000000000001"><name>Hollow Coves</name><sort-name>Hollow Coves</sort-name></artist></name-credit></artist-credit>
+<release-group id="00000000-0000-0000-0000-000000000002" type="EP"><primary-type>EP</primary-type></release-group>
+<label-info-list><label-info><catalog-number>SD001</catalog-number><label id="00000000-0000-0000-0000-000000000003"><name>Static Records</name></label></label-info></label-info-list>
+</release></release-list></metadata>'''
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''
+    Answers like Bandcamp, MusicBrainz, RED's ajax.php and ptpimg, from fixtures and canned responses.
+    '''
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, body, content_type="text/html; charset=utf-8"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/search":
+            self.respond(open(os.path.join(fixtures, "search.html"), 'rb').read())
+        elif url.path.startswith("/album/"):
+            self.respond(open(os.path.join(fixtures, "album.html"), 'rb').read())
+        elif url.path.startswith("/cover/"):
+            self.respond(seeded_bytes(url.path, 200000), "image/jpeg")
+        elif url.path.startswith("/ws/2/release"):
+            self.respond(musicbrainz_response, "application/xml; charset=utf-8")
+        elif url.path == "/ajax.php" and query.get('action') == ['index']:
+            self.respond(json.dumps({"status": "success", "response": {"authkey": "authkey", "passkey": "passkey"}}).encode(), "application/json")
+        elif url.path == "/ajax.php" and query.get('action') == ['artist']:
+            groups = [{"groupName": f"Release {i}", "torrent": [{"format": "FLAC", "encoding": "Lossless"}]} for i in range(50)]
+            self.respond(json.dumps({"status": "success", "response": {"torrentgroup": groups}}).encode(), "application/json")
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path == "/upload.php":
+            code = "".join(random.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=6))
+            self.respond(json.dumps([{"code": code, "ext": "png"}]).encode(), "application/json")
+        else:
+            self.send_error(404)
+
+def seeded_bytes(seed, size):
+    return random.Random(seed).getrandbits(size * 8).to_bytes(size, 'little')
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def make_release(work_dir, name, profile, scale):
+    '''
+    Generates a tagged synthetic release with ffmpeg and zips it, returns the zip path. Pink noise is seeded, so releases are reproducible.
+    '''
+    artist = "Hollow Coves"
+    album = f"Synthetic {name.title()}"
+    zip_path = os.path.join(work_dir, f"{artist} - {album}.zip")
+    if os.path.exists(zip_path):
+        return zip_path
+
+    source_dir = os.path.join(work_dir, name)
+    os.makedirs(source_dir, exist_ok=True)
+    sample_format = ["-sample_fmt", "s32", "-bits_per_raw_sample", "24"] if profile['bits'] == 24 else ["-sample_fmt", "s16"]
+    for i in range(profile['tracks']):
+        length = max(1, int(profile['length'] * scale))
+        track = os.path.join(source_dir, f"{artist} - {album} - {i + 1:02d} Track {i + 1}.flac")
+        command = ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"anoisesrc=d={length}:c=pink:r={profile['rate']}:a=0.3:seed={i + 1}", "-ac", "2", "-c:a", "flac", *sample_format]
+        command += ["-metadata", f"artist={artist}", "-metadata", f"album={album}", "-metadata", f"title=Track {i + 1}", "-metadata", f"tracknumber={i + 1}", "-metadata", "date=2021", track]
+        subprocess.run(command, check=True)
+
+    with open(os.path.join(source_dir, "cover.jpg"), 'wb') as file:
+        file.write(seeded_bytes(name, 300000))
+
+    with zipfile.ZipFile(zip_path + ".part", 'w', zipfile.ZIP_STORED) as zf:
+        for file in sorted(os.listdir(source_dir)):
+            zf.write(os.path.join(source_dir, file), file)
+    os.rename(zip_path + ".part", zip_path)
+    shutil.rmtree(source_dir)
+    return zip_path
+
+def read_io():
+    '''Returns the bytes this process has read and written, including pipes and the page cache'''
+    try:
+        with open("/proc/self/io") as file:
+            counters = dict(line.split(": ") for line in file.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def read_rss():
+    '''Returns the resident set size of this process in KiB'''
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def measure(function):
+    '''
+    Runs function and returns its wall time, CPU time (with waited-for children), bytes read and written, and peak RSS.
+    '''
+    peak = [read_rss()]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.01):
+            rss = read_rss()
+            if rss and (peak[0] is None or rss > peak[0]):
+                peak[0] = rss
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+
+    read_before, written_before = read_io()
+    times_before = os.times()
+    start = time.perf_counter()
+    try:
+        function()
+    finally:
+        wall = time.perf_counter() - start
+        times_after = os.times()
+        read_after, written_after = read_io()
+        done.set()
+        sampler.join()
+
+    return {
+        "wall_s": round(wall, 4),
+        "cpu_s": round(times_after.user - times_before.user + times_after.system - times_before.system, 4),
+        "children_cpu_s": round(times_after.children_user - times_before.children_user + times_after.children_system - times_before.children_system, 4),
+        "bytes_read": read_after - read_before if read_before is not None else None,
+        "bytes_written": written_after - written_before if written_before is not None else None,
+        "peak_rss_kib": peak[0],
+    }
+
+def run_release(zip_path, work_dir, api, uploader, host, lac):
+    stages = {}
+    state = {}
+    data_dir = os.path.join(work_dir, "data")
+    album_slug = os.path.splitext(os.path.basename(zip_path))[0].split(" - ", 1)[1].lower().replace(" ", "-")
+
+    def extract():
+        state['release'] = utils.extract_release(zip_path, data_dir, allowed_extensions)
+
+    stages["extract"] = measure(extract)
+    release_dir, album, artist, release_manifest = state['release']
+
+    stages["scan"] = measure(lambda: manifest.scan_release(release_dir))
+    stages["is_24bit"] = measure(lambda: transcode.is_24bit(release_dir, release_manifest))
+    stages["bandcamp_search"] = measure(lambda: bandcamp.get_album_url(album, artist))
+    stages["bandcamp_album"] = measure(lambda: state.update(info=bandcamp.get_album_info(f"{host}/album/{album_slug}")))
+    stages["cover_rehost"] = measure(lambda: uploader.rehost(f"{host}/cover/{album_slug}.jpg"))
+    stages["musicbrainz"] = measure(lambda: musicbrainz.search_releases(artist, album))
+    stages["redacted_dupe"] = measure(lambda: api.is_duplicate({"artist": artist, "album": album, "bitrate": "Lossless"}))
+
+    if lac:
+        stages["is_lossless"] = measure(lambda: transcode.is_lossless(release_dir, release_manifest))
+    else:
+        stages["is_lossless"] = {"skipped": "./LAC not found"}
+
+    stages["spectrograms"] = measure(lambda: transcode.make_spectrograms(release_dir, uploader, release_manifest))
+    stages["torrent"] = measure(lambda: transcode.make_torrent(os.path.join(work_dir, "release.torrent"), release_dir, api.tracker, api.passkey))
+
+    tracks = release_manifest['tracks']
+    result = {
+        "release": os.path.basename(zip_path),
+        "tracks": len(tracks),
+        "bits_per_sample": max(track['bits_per_sample'] for track in tracks),
+        "sample_rate": tracks[0]['sample_rate'],
+        "seconds": round(sum(track['length'] for track in tracks), 1),
+        "bytes": sum(track['size'] for track in tracks),
+        "stages": stages,
+    }
+    shutil.rmtree(release_dir)
+    os.remove(os.path.join(work_dir, "release.torrent"))
+    return result
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--profiles', help='Synthetic releases to run', nargs='+', choices=list(profiles), default=list(profiles))
+    parser.add_argument('--scale', help='Multiplier for track lengths', type=float, default=1.0)
+    parser.add_argument('--work-dir', help='Directory for generated releases, kept between runs if given')
+    parser.add_argument('--output', help='Write the JSON report to a file instead of stdout')
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg"):
+        sys.exit("ffmpeg not found")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="redcamp_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    server = start_server()
+    host = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        #Point every service at the stand-in server, without rate limits
+        bandcamp.session = webcache.CachedSession()
+        bandcamp.search_url = f"{host}/search?q="
+        musicbrainzngs.set_useragent("REDCamp-Benchmark", "1.0")
+        musicbrainzngs.set_hostname(host.split("//")[1])
+        musicbrainz.limiter = ratelimit.SlidingWindow(1000, 1.0)
+        musicbrainz.set_cache(None)
+        api = redacted.RedactedAPI("api_key", requests_per_window=1000, window=1.0, site=f"{host}/")
+        uploader = ptpimg.PtpimgUploader("api_key", host=host)
+        lac = os.path.exists("./LAC")
+
+        zips = [make_release(work_dir, name, profiles[name], args.scale) for name in args.profiles]
+        releases = [run_release(zip_path, work_dir, api, uploader, host, lac) for zip_path in zips]
+    finally:
+        server.shutdown()
+        if not args.work_dir:
+            shutil.rmtree(work_dir)
+
+    totals = {}
+    for release in releases:
+        for stage, metrics in release['stages'].items():
+            total = totals.setdefault(stage, {"wall_s": 0, "cpu_s": 0, "children_cpu_s": 0})
+            for key in total:
+                total[key] = round(total[key] + metrics.get(key, 0), 4)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": args.scale,
+        "releases": releases,
+        "totals": totals,
+    }
+
+    output = json.dumps(report, indent=4)
+    if args.output:
+        utils.write_file(args.output, output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
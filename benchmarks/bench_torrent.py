@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+# Compares torrent.make_torrent against mktorrent on a synthetic release
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torrent
+
+def make_release(dir, tracks, track_size):
+    for i in range(tracks):
+        with open(os.path.join(dir, f"{i + 1:02d} Track.flac"), 'wb') as file:
+            remaining = track_size
+            while remaining:
+                chunk = min(remaining, 2**22)
+                file.write(os.urandom(chunk))
+                remaining -= chunk
+    with open(os.path.join(dir, "cover.jpg"), 'wb') as file:
+        file.write(os.urandom(123457))
+
+def read_pieces(path):
+    data = open(path, 'rb').read()
+    start = data.index(b'6:pieces') + len(b'6:pieces')
+    length, data = data[start:].split(b':', 1)
+    return data[:int(length)]
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--tracks', help='Number of tracks', type=int, default=12)
+    parser.add_argument('--track-size', help='Size of each track in MiB', type=int, default=40)
+    parser.add_argument('--piece-length', help='Piece length as a power of 2', type=int, default=18)
+    parser.add_argument('--workers', help='Number of hashing threads', type=int, default=None)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        release_dir = os.path.join(work_dir, "Artist - Album [FLAC]")
+        os.makedirs(release_dir)
+        make_release(release_dir, args.tracks, args.track_size * 2**20)
+        total = args.tracks * args.track_size
+
+        announce = "https://flacsfor.me/passkey/announce"
+        piece_cache = os.path.join(work_dir, "pieces")
+        native = os.path.join(work_dir, "native.torrent")
+
+        results = {}
+        results["native"] = timed(lambda: torrent.make_torrent(native, release_dir, announce, 2 ** args.piece_length, workers=args.workers, cache_dir=piece_cache))
+        results["native (cached)"] = timed(lambda: torrent.make_torrent(native, release_dir, announce, 2 ** args.piece_length, workers=args.workers, cache_dir=piece_cache))
+        results["native (1 thread)"] = timed(lambda: torrent.make_torrent(native, release_dir, announce, 2 ** args.piece_length, workers=1))
+
+        if shutil.which("mktorrent"):
+            reference = os.path.join(work_dir, "mktorrent.torrent")
+            command = ["mktorrent", "-s", "RED", "-p", "-a", announce, "-o", reference, "-l", str(args.piece_length), release_dir]
+            results["mktorrent"] = timed(lambda: subprocess.check_output(command, stderr=subprocess.STDOUT))
+            print(f"Pieces match mktorrent: {read_pieces(native) == read_pieces(reference)}")
+        else:
+            print("mktorrent not found, skipping")
+
+        for name, elapsed in results.items():
+            print(f"{name:20} {elapsed:8.3f}s {total / elapsed:10.1f} MiB/s")
+    finally:
+        shutil.rmtree(work_dir)
+
+if __name__ == "__main__":
+    main()
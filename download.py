@@ -0,0 +1,200 @@
+import re
+import os
+import json
+import logging
+import time
+import hashlib
+import http.client
+import threading
+import urllib.error
+import urllib.request
+
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import utils
+
+chunk_size = 1 << 20
+max_retries = 5
+
+class Downloader:
+    def __init__(self, output_dir, cache, workers=4, host_connections=2, logger=None):
+        self.output_dir = output_dir
+        self.cache = cache
+        self.workers = workers
+        self.host_connections = host_connections
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.downloaded = 0
+        self.bytes = 0
+
+    def _host_slot(self, url):
+        '''Returns the semaphore capping concurrent connections to the host of url'''
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = threading.BoundedSemaphore(self.host_connections)
+            return self.hosts[host]
+
+    def _part_path(self, download_link):
+        '''Returns the partial download path for a link, stable across runs'''
+        key = hashlib.md5(download_link.encode('utf-8')).hexdigest()[0:12]
+        return os.path.join(self.output_dir, f".redcamp_{key}.part")
+
+    def _read_state(self, part_path):
+        '''Returns the sidecar of a partial download, or None if it can't be resumed'''
+        state = utils.read_file(part_path + ".json")
+        if not state or not os.path.exists(part_path):
+            return None
+        try:
+            return json.loads(state)
+        except ValueError:
+            return None
+
+    def _open(self, download_link, part_path, state):
+        '''Opens the download, asking for the remainder of the partial file if there is one'''
+        request = urllib.request.Request(download_link)
+        offset = os.path.getsize(part_path) if state else 0
+        if offset:
+            request.add_header('Range', f'bytes={offset}-')
+            if state.get('etag'):
+                request.add_header('If-Range', state['etag'])
+
+        response = urllib.request.urlopen(request)
+        if offset and response.status == 206:
+            match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', response.headers.get('Content-Range', ''))
+            if match and int(match.group(1)) == offset and match.group(2) in (str(state['length']), '*'):
+                return response, offset
+
+            #Server returned a range we didn't ask for, start over
+            response.close()
+            response = urllib.request.urlopen(download_link)
+
+        return response, 0
+
+    def _stream(self, response, part_path, offset):
+        '''Streams the response body to part_path from offset, returns the number of bytes written'''
+        written = 0
+        with open(part_path, 'ab' if offset else 'wb') as file:
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                file.write(chunk)
+                written += len(chunk)
+        return written
+
+    def _backoff(self, slot, failures):
+        '''Waits before a retry, letting other downloads use the host's connection meanwhile'''
+        slot.release()
+        try:
+            time.sleep(2 ** failures)
+        finally:
+            slot.acquire()
+
+    def _complete(self, release_url, part_path, file_name, written):
+        '''Moves a verified download into place and records it'''
+        os.rename(part_path, os.path.join(self.output_dir, file_name))
+        os.remove(part_path + ".json")
+        with self.lock:
+            self.cache[file_name] = release_url
+            self.downloaded += 1
+            self.bytes += written
+        return file_name
+
+    def fetch(self, release_url, download_link):
+        '''Downloads a single release using one streamed request, resuming any partial download'''
+        part_path = self._part_path(download_link)
+        failures = 0
+        written = 0
+
+        slot = self._host_slot(download_link)
+        with slot:
+            while failures < max_retries:
+                state = self._read_state(part_path)
+
+                #A partial download may have completed before a crash, so it only needs renaming
+                if state and state.get('length') is not None and os.path.getsize(part_path) >= state['length']:
+                    if os.path.getsize(part_path) == state['length']:
+                        return self._complete(release_url, part_path, state['file_name'], written)
+                    os.remove(part_path)
+                    state = None
+
+                try:
+                    response, offset = self._open(download_link, part_path, state)
+                except urllib.error.HTTPError as e:
+                    #The server couldn't satisfy the range, start over
+                    if e.code == 416 and state:
+                        self.logger.error("Invalid Range. Restarting...")
+                        os.remove(part_path)
+                        failures += 1
+                        continue
+                    self.logger.error(f"Invalid URL. Skipping...")
+                    return None
+                except (urllib.error.URLError, OSError):
+                    self.logger.error("Connection Error. Retrying...")
+                    failures += 1
+                    self._backoff(slot, failures)
+                    continue
+
+                with response:
+                    if offset:
+                        file_name = state['file_name']
+                        length = state['length']
+                    else:
+                        file_name = response.info().get_filename()
+                        if not file_name:
+                            self.logger.error(f"No File Name for {release_url}. Skipping...")
+                            return None
+                        file_name = file_name.encode('latin-1').decode('utf-8')
+                        length = response.headers.get('Content-Length')
+                        length = int(length) if length is not None else None
+
+                    file_path = os.path.join(self.output_dir, file_name)
+                    if os.path.exists(file_path):
+                        return None
+
+                    if not offset:
+                        state = {"url": download_link, "file_name": file_name, "etag": response.headers.get('ETag'), "length": length}
+                        utils.write_file(part_path + ".json", json.dumps(state))
+
+                    try:
+                        if offset:
+                            self.logger.info(f"Resuming Release: {file_name} ({offset}/{length} bytes)")
+                        else:
+                            self.logger.info(f"Downloading Release: {file_name}")
+                        written += self._stream(response, part_path, offset)
+                    except (http.client.IncompleteRead, OSError):
+                        self.logger.error("Download Error. Resuming...")
+                        progress = os.path.getsize(part_path) - offset
+                        written += progress
+                        failures = 0 if progress > 0 else failures + 1
+                        continue
+
+                #Verify Size
+                size = os.path.getsize(part_path)
+                if length is not None and size != length:
+                    self.logger.error(f"Size Mismatch ({size}/{length} bytes). Resuming...")
+                    if size > length:
+                        os.remove(part_path)
+                    failures = 0 if offset < size < length else failures + 1
+                    continue
+
+                return self._complete(release_url, part_path, file_name, written)
+
+        self.logger.error(f"Download Failed: {release_url}")
+        return None
+
+    def run(self, releases):
+        '''Downloads a list of (release_url, download_link) pairs'''
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.fetch, release_url, download_link): release_url for release_url, download_link in releases}
+        for future, release_url in futures.items():
+            if future.exception():
+                self.logger.error(f"Download Failed: {release_url} ({future.exception()!r})")
+        elapsed = max(time.time() - start, 1e-6)
+
+        self.logger.info(f"Downloaded {self.downloaded} Releases ({self.bytes / 2**20:.1f} MiB) in {elapsed:.1f}s ({self.bytes / 2**20 / elapsed:.2f} MiB/s)")
+        return self.downloaded
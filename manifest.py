@@ -0,0 +1,33 @@
+import os
+import mutagen.flac
+
+def track_info(path, flac, size):
+    '''
+    Returns the manifest entry for a FLAC: its tags, STREAMINFO, size and duration.
+    '''
+    return {
+        "path": path,
+        "tags": flac.tags.as_dict() if flac.tags else {},
+        "bits_per_sample": flac.info.bits_per_sample,
+        "sample_rate": flac.info.sample_rate,
+        "channels": flac.info.channels,
+        "total_samples": flac.info.total_samples,
+        "length": flac.info.length,
+        "size": size,
+    }
+
+def make_manifest(release_dir, tracks):
+    return {"dir": release_dir, "tracks": sorted(tracks, key=lambda track: track['path'])}
+
+def scan_release(release_dir):
+    '''
+    Reads every FLAC in release_dir once and returns its manifest.
+    '''
+    tracks = []
+    for path, dirs, files in os.walk(release_dir):
+        for filename in files:
+            if os.path.splitext(filename)[-1].lower() != ".flac" or filename.startswith('.'):
+                continue
+            flac_path = os.path.abspath(os.path.join(path, filename))
+            tracks.append(track_info(flac_path, mutagen.flac.FLAC(flac_path), os.path.getsize(flac_path)))
+    return make_manifest(release_dir, tracks)
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import threading
+import contextlib
+
+#Histogram buckets in seconds
+buckets = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+prefix = "redcamp_"
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+class Metrics:
+    '''
+    Collects latency histograms and counters, and writes each observation as a JSON-lines event if events_path is set.
+    write_textfile writes everything collected in the Prometheus text format for the node exporter's textfile collector.
+    '''
+    def __init__(self, events_path=None, textfile_path=None):
+        self.textfile_path = textfile_path
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.events = open(events_path, 'a', encoding='utf-8') if events_path else None
+
+    def event(self, name, **fields):
+        if not self.events:
+            return
+        line = json.dumps({"time": round(time.time(), 3), "event": name, **fields}, default=str)
+        with self.lock:
+            self.events.write(line + "\n")
+            self.events.flush()
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            for i, bound in enumerate(buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextlib.contextmanager
+    def timer(self, name, fields=None, **labels):
+        '''
+        Times the body as a histogram observation of name, and logs it as an event with any extra fields.
+        Errors are counted and logged too, then raised again. Yields the labels, which the body may update.
+        '''
+        start = time.perf_counter()
+        error = None
+        try:
+            yield labels
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(name, seconds, **labels)
+            if error:
+                self.count(name.replace("_seconds", "") + "_errors_total", **labels)
+            self.event(name, seconds=round(seconds, 4), error=error, **labels, **(fields or {}))
+
+    def write_textfile(self):
+        if not self.textfile_path:
+            return
+        lines = []
+        with self.lock:
+            for name in sorted({key[0] for key in self.histograms}):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for (histogram_name, labels), (counts, total, count) in sorted(self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    for bound, bucket_count in zip(buckets, counts):
+                        lines.append(f"{prefix}{name}_bucket{format_labels(labels, le=bound)} {bucket_count}")
+                    lines.append(f"{prefix}{name}_bucket{format_labels(labels, le='+Inf')} {count}")
+                    lines.append(f"{prefix}{name}_sum{format_labels(labels)} {total}")
+                    lines.append(f"{prefix}{name}_count{format_labels(labels)} {count}")
+            for name in sorted({key[0] for key in self.counters}):
+                lines.append(f"# TYPE {prefix}{name} counter")
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append(f"{prefix}{name}{format_labels(labels)} {value}")
+
+        #The collector may read at any time, so replace the file in one step
+        with open(self.textfile_path + ".tmp", 'w') as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(self.textfile_path + ".tmp", self.textfile_path)
+
+    def close(self):
+        self.write_textfile()
+        if self.events:
+            self.events.close()
+            self.events = None
+
+recorder = Metrics()
+
+def configure(events_path=None, textfile_path=None):
+    global recorder
+    recorder = Metrics(events_path, textfile_path)
+
+def event(name, **fields):
+    recorder.event(name, **fields)
+
+def observe(name, seconds, **labels):
+    recorder.observe(name, seconds, **labels)
+
+def count(name, value=1, **labels):
+    recorder.count(name, value, **labels)
+
+def timer(name, fields=None, **labels):
+    return recorder.timer(name, fields, **labels)
+
+def write_textfile():
+    recorder.write_textfile()
+
+def close():
+    recorder.close()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import lzma
+import gzip
+import json
+import time
+import sqlite3
+import tarfile
+import argparse
+import threading
+
+import musicbrainzngs
+
+import utils
+import metrics
+import ratelimit
+
+#MusicBrainz allows one request per second, shared by every thread in the process
+limiter = ratelimit.SlidingWindow(1, 1.0)
+musicbrainzngs.set_rate_limit(False)
+
+retries = 3
+
+class LookupCache:
+    '''
+    Caches search results in SQLite, keyed by normalized artist and album.
+    Empty results are cached too, for a shorter time.
+    '''
+    def __init__(self, path=None, ttl=30 * 24 * 60 * 60, negative_ttl=24 * 60 * 60):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS lookups (key TEXT PRIMARY KEY, response TEXT, found INTEGER, fetched REAL)")
+        self.db.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT response, found, fetched FROM lookups WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        response, found, fetched = row
+        if time.time() - fetched > (self.ttl if found else self.negative_ttl):
+            return None
+        return json.loads(response)
+
+    def set(self, key, response):
+        found = 1 if response.get('release-list') else 0
+        with self.lock:
+            self.db.execute("REPLACE INTO lookups VALUES (?, ?, ?, ?)", (key, json.dumps(response), found, time.time()))
+            self.db.commit()
+
+class LocalIndex:
+    '''
+    A local SQLite index of a MusicBrainz release dump, answering searches in the same shape as musicbrainzngs.
+    '''
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS releases (id TEXT PRIMARY KEY, artist TEXT, title TEXT, artist_key TEXT, title_key TEXT, data TEXT)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS releases_key ON releases (artist_key, title_key)")
+        self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS releases_fts USING fts5(artist, title, content='releases', content_rowid='rowid')")
+        self.db.commit()
+
+    def import_releases(self, releases, batch=10000):
+        '''Loads release entities from a JSON dump, returns the number imported'''
+        self.db.execute("PRAGMA synchronous=OFF")
+        count = 0
+        rows = []
+        for entity in releases:
+            release = convert_release(entity)
+            artist = credit_name(release['artist-credit'])
+            rows.append((entity['id'], artist, release['title'], utils.normalize(artist), utils.normalize(release['title']), json.dumps(release)))
+            if len(rows) >= batch:
+                self.db.executemany("REPLACE INTO releases VALUES (?, ?, ?, ?, ?, ?)", rows)
+                count += len(rows)
+                rows = []
+        self.db.executemany("REPLACE INTO releases VALUES (?, ?, ?, ?, ?, ?)", rows)
+        count += len(rows)
+        self.db.execute("INSERT INTO releases_fts(releases_fts) VALUES('rebuild')")
+        self.db.commit()
+        return count
+
+    def search(self, artist, album, limit=5, fuzzy=True):
+        '''Returns exact matches on normalized artist and album, or the closest full-text matches if fuzzy'''
+        with self.lock:
+            rows = self.db.execute("SELECT data FROM releases WHERE artist_key = ? AND title_key = ? LIMIT ?", (utils.normalize(artist), utils.normalize(album), limit)).fetchall()
+            if not rows and fuzzy:
+                query = f"artist : {fts_phrase(artist)} AND title : {fts_phrase(album)}"
+                try:
+                    rows = self.db.execute("SELECT releases.data FROM releases_fts JOIN releases ON releases.rowid = releases_fts.rowid WHERE releases_fts MATCH ? ORDER BY rank LIMIT ?", (query, limit)).fetchall()
+                except sqlite3.OperationalError:
+                    rows = []
+        return {"release-list": [json.loads(row[0]) for row in rows]}
+
+def fts_phrase(value):
+    return '"' + value.replace('"', '""') + '"'
+
+def credit_name(artist_credit):
+    return "".join(credit['name'] + credit.get('joinphrase', '') for credit in artist_credit if isinstance(credit, dict))
+
+def convert_release(entity):
+    '''
+    Converts a release from the JSON dump to the parts of the musicbrainzngs search result shape that we use.
+    '''
+    artist_credit = []
+    for credit in entity.get('artist-credit', []):
+        artist_credit.append({"name": credit.get('name', credit['artist']['name']), "joinphrase": credit.get('joinphrase', ''), "artist": {"id": credit['artist']['id'], "name": credit['artist']['name']}})
+
+    release_group = entity.get('release-group') or {}
+    label_info = []
+    for label in entity.get('label-info') or []:
+        info = {}
+        if label.get('label'):
+            info['label'] = {"name": label['label']['name']}
+        if label.get('catalog-number'):
+            info['catalog-number'] = label['catalog-number']
+        label_info.append(info)
+
+    return {
+        "id": entity['id'],
+        "title": entity['title'],
+        "artist-credit": artist_credit,
+        "release-group": {"primary-type": release_group.get('primary-type'), "secondary-type-list": release_group.get('secondary-types') or []},
+        "label-info-list": label_info
+    }
+
+def read_dump(path):
+    '''
+    Yields the release entities of a JSON dump: the release.tar.xz archive or its extracted mbdump/release file.
+    '''
+    if tarfile.is_tarfile(path):
+        with tarfile.open(path, 'r|*') as archive:
+            for member in archive:
+                if member.name.endswith("mbdump/release"):
+                    for line in archive.extractfile(member):
+                        yield json.loads(line)
+                    return
+        return
+
+    opener = lzma.open if path.endswith(".xz") else gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rt', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+cache = LookupCache()
+index = None
+
+def set_cache(path):
+    global cache
+    cache = LookupCache(path)
+
+def set_index(path):
+    global index
+    index = LocalIndex(path) if path and os.path.exists(path) else None
+
+def lookup_key(artist, album):
+    return utils.normalize(artist) + "\x1f" + utils.normalize(album)
+
+def search_releases(artist, album, limit=5):
+    '''
+    Returns musicbrainzngs.search_releases for an artist and album, from the cache if possible.
+    '''
+    #Full-text matches could hide a release missing from the dump, so only exact matches skip the web service
+    if index:
+        results = index.search(artist, album, limit, fuzzy=False)
+        if results['release-list']:
+            return results
+
+    key = lookup_key(artist, album)
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    for attempt in range(retries):
+        delay = limiter.wait('search')
+        if delay:
+            metrics.count("throttled_requests_total", service="musicbrainz")
+            metrics.count("throttle_seconds_total", delay, service="musicbrainz")
+        try:
+            with metrics.timer("request_seconds", service="musicbrainz", kind="search"):
+                results = musicbrainzngs.search_releases(artist=artist, release=album, limit=limit)
+            break
+        except musicbrainzngs.WebServiceError:
+            if attempt == retries - 1:
+                raise
+            metrics.count("retries_total", service="musicbrainz")
+            time.sleep(2 ** attempt)
+
+    cache.set(key, results)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter, prog='musicbrainz')
+    parser.add_argument('--index', help='Location of local MusicBrainz index', default=os.path.expanduser('~/.redcamp/musicbrainz-index.db'))
+    subparsers = parser.add_subparsers(dest='command')
+    import_parser = subparsers.add_parser('import', help='Import a MusicBrainz JSON release dump into the index')
+    import_parser.add_argument('dump', help='release.tar.xz, or the extracted mbdump/release file')
+    lookup_parser = subparsers.add_parser('lookup', help='Search the index')
+    lookup_parser.add_argument('artist')
+    lookup_parser.add_argument('album')
+
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        if not os.path.exists(os.path.dirname(args.index)):
+            os.makedirs(os.path.dirname(args.index))
+        start = time.time()
+        count = LocalIndex(args.index).import_releases(read_dump(args.dump))
+        print(f"Imported {count} releases in {time.time() - start:.0f}s")
+    elif args.command == 'lookup':
+        print(json.dumps(LocalIndex(args.index).search(args.artist, args.album), indent=4))
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
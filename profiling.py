@@ -0,0 +1,140 @@
+import io
+import os
+import time
+import pstats
+import cProfile
+import threading
+import subprocess
+import tracemalloc
+
+_popen_init = subprocess.Popen.__init__
+_popen_wait = subprocess.Popen.wait
+
+def command_name(args):
+    if isinstance(args, (list, tuple)):
+        args = args[0] if args else ""
+    args = os.fsdecode(args)
+    return os.path.basename(args.split()[0]) if args.split() else args
+
+class Profiler:
+    '''
+    Profiles each release with cProfile and tracemalloc and writes a report for it to output_dir,
+    with the wall time of every subprocess (ffmpeg, LAC) it waited on. finish writes a summary merged across releases.
+    cProfile follows the main thread only, tracemalloc and the subprocess times cover every thread.
+    '''
+    def __init__(self, output_dir, top=25):
+        self.output_dir = output_dir
+        self.top = top
+        self.lock = threading.Lock()
+        self.current = None
+        self.profile_files = []
+        self.allocations = {}
+        self.subprocesses = {}
+        self.filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"), tracemalloc.Filter(False, __file__)]
+        os.makedirs(output_dir, exist_ok=True)
+
+        tracemalloc.start()
+        self._patch_subprocess()
+
+    def _patch_subprocess(self):
+        profiler = self
+
+        def init(popen, args, *rest, **kwargs):
+            popen._profile_start = time.perf_counter()
+            popen._profile_command = command_name(args)
+            _popen_init(popen, args, *rest, **kwargs)
+
+        def wait(popen, *rest, **kwargs):
+            result = _popen_wait(popen, *rest, **kwargs)
+            if hasattr(popen, '_profile_start') and not getattr(popen, '_profile_done', False):
+                popen._profile_done = True
+                profiler._record_subprocess(popen._profile_command, time.perf_counter() - popen._profile_start)
+            return result
+
+        subprocess.Popen.__init__ = init
+        subprocess.Popen.wait = wait
+
+    def _record_subprocess(self, command, seconds):
+        with self.lock:
+            if self.current:
+                calls = self.current['subprocesses'].setdefault(command, [0, 0.0])
+                calls[0] += 1
+                calls[1] += seconds
+            calls = self.subprocesses.setdefault(command, [0, 0.0])
+            calls[0] += 1
+            calls[1] += seconds
+
+    def begin(self, name):
+        '''Finishes the report of the previous release, and starts profiling the next one'''
+        self.end()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        profile = cProfile.Profile()
+        with self.lock:
+            self.current = {"name": name, "profile": profile, "subprocesses": {}, "snapshot": tracemalloc.take_snapshot().filter_traces(self.filters), "start": time.perf_counter()}
+        profile.enable()
+
+    def end(self):
+        '''Stops profiling the current release and writes its report'''
+        if not self.current:
+            return
+        current = self.current
+        current['profile'].disable()
+        wall = time.perf_counter() - current['start']
+        snapshot = tracemalloc.take_snapshot().filter_traces(self.filters)
+        peak = tracemalloc.get_traced_memory()[1]
+        with self.lock:
+            self.current = None
+
+        base = os.path.join(self.output_dir, os.path.splitext(os.path.basename(current['name']))[0])
+        current['profile'].dump_stats(base + ".prof")
+        self.profile_files.append(base + ".prof")
+
+        allocations = [stat for stat in snapshot.compare_to(current['snapshot'], 'lineno') if stat.size_diff > 0]
+        for stat in allocations:
+            total = self.allocations.setdefault(str(stat.traceback[0]), [0, 0])
+            total[0] += stat.size_diff
+            total[1] += stat.count_diff
+
+        report = [f"Release: {current['name']}", f"Wall time: {wall:.2f}s", f"Peak traced memory: {peak / 2**20:.1f} MiB", ""]
+        report += self._format_subprocesses(current['subprocesses'], wall)
+        report += ["Allocations retained, by line:"]
+        report += [f"  {stat.size_diff / 1024:10.1f} KiB {stat.count_diff:8d} blocks  {stat.traceback[0]}" for stat in allocations[:self.top]]
+        report += ["", self._format_stats(pstats.Stats(base + ".prof"), "cumulative")]
+        with open(base + ".txt", 'w') as file:
+            file.write("\n".join(report))
+
+    def _format_subprocesses(self, subprocesses, wall=None):
+        lines = ["Subprocesses:"]
+        for command, (calls, seconds) in sorted(subprocesses.items(), key=lambda item: -item[1][1]):
+            share = f" ({seconds / wall:.0%} of wall time)" if wall else ""
+            lines.append(f"  {command:16} {calls:6d} calls {seconds:10.2f}s{share}")
+        return lines + [""]
+
+    def _format_stats(self, stats, sort):
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats(sort).print_stats(self.top)
+        return stream.getvalue()
+
+    def finish(self):
+        '''Writes the summary merged across every release, returns its path'''
+        self.end()
+        subprocess.Popen.__init__ = _popen_init
+        subprocess.Popen.wait = _popen_wait
+        tracemalloc.stop()
+
+        summary = [f"Releases: {len(self.profile_files)}", ""]
+        summary += self._format_subprocesses(self.subprocesses)
+        summary += ["Biggest allocators, by line:"]
+        for line, (size, count) in sorted(self.allocations.items(), key=lambda item: -item[1][0])[:self.top]:
+            summary.append(f"  {size / 1024:10.1f} KiB {count:8d} blocks  {line}")
+        if self.profile_files:
+            stats = pstats.Stats(*self.profile_files)
+            summary += ["", "Hottest functions, by own time:", self._format_stats(stats, "tottime")]
+            summary += ["Hottest functions, by cumulative time:", self._format_stats(stats, "cumulative")]
+
+        path = os.path.join(self.output_dir, "summary.txt")
+        with open(path, 'w') as file:
+            file.write("\n".join(summary))
+        return path
@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import utils
+import metrics
+
+class UploadException(Exception):
+    pass
+
+class PtpimgUploader:
+    def __init__(self, api_key, cache_path=None, workers=4, retries=5, host="https://ptpimg.me", logger=None):
+        self.api_key = api_key
+        self.cache_path = cache_path
+        self.workers = workers
+        self.retries = retries
+        self.host = host
+        self.logger = logger
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.pending = {}
+
+        cache = utils.read_file(cache_path) if cache_path else ""
+        try:
+            self.cache = json.loads(cache) if cache else {}
+        except ValueError:
+            if logger:
+                logger.warning(f"Image Cache {cache_path} is Corrupt. Starting Over...")
+            self.cache = {}
+
+    def _remember(self, digest, url):
+        with self.lock:
+            self.cache[digest] = url
+            if self.cache_path:
+                #Replace the file in one step, so a crash can't leave it half written
+                utils.write_file(self.cache_path + ".tmp", json.dumps(self.cache, indent=4, sort_keys=True))
+                os.replace(self.cache_path + ".tmp", self.cache_path)
+
+    def _post(self, name, data, mime_type):
+        '''Uploads one image, retrying with exponential backoff'''
+        for attempt in range(self.retries):
+            try:
+                with metrics.timer("request_seconds", {"image": name, "attempt": attempt}, service="ptpimg", kind="upload"):
+                    r = self.session.post(f"{self.host}/upload.php", headers={'referer': f"{self.host}/index.php"}, data={'api_key': self.api_key}, files={'file-upload[]': (name, data, mime_type)}, timeout=60)
+                metrics.count("request_bytes_total", len(data), service="ptpimg")
+                if r.status_code == 200:
+                    image = r.json()[0]
+                    return f"{self.host}/{image['code']}.{image['ext']}"
+                if r.status_code == 429:
+                    metrics.count("throttled_requests_total", service="ptpimg")
+                elif r.status_code < 500:
+                    raise UploadException(f"Upload of {name} failed with status {r.status_code}")
+            except (requests.RequestException, ValueError, IndexError, KeyError):
+                pass
+            if self.logger:
+                self.logger.warning(f"Upload of {name} failed. Retrying...")
+            metrics.count("retries_total", service="ptpimg")
+            time.sleep(2 ** attempt)
+        raise UploadException(f"Upload of {name} failed after {self.retries} attempts")
+
+    def upload(self, name, data, mime_type="image/png"):
+        '''Uploads image bytes, unless the same image has been uploaded before'''
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            if digest in self.cache:
+                return self.cache[digest]
+            #Wait for an upload of the same image that is already in flight
+            if digest in self.pending:
+                pending, owner = self.pending[digest], False
+            else:
+                pending, owner = self.pending.setdefault(digest, Future()), True
+        if not owner:
+            return pending.result()
+
+        try:
+            url = self._post(name, data, mime_type)
+            self._remember(digest, url)
+            pending.set_result(url)
+            return url
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.pending[digest]
+
+    def upload_images(self, images):
+        '''Uploads a list of (file name, PNG bytes) concurrently, returns their URLs in order'''
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda image: self.upload(*image), images))
+
+    def rehost(self, url):
+        '''Uploads the image at url, returns its ptpimg URL'''
+        with metrics.timer("request_seconds", {"url": url}, service="ptpimg", kind="rehost"):
+            r = self.session.get(url, timeout=60)
+            r.raise_for_status()
+        metrics.count("response_bytes_total", len(r.content), service="ptpimg")
+        mime_type = r.headers.get('Content-Type', 'image/jpeg').split(";")[0]
+        return self.upload(url.rsplit("/", 1)[-1] or "cover", r.content, mime_type)
@@ -0,0 +1,36 @@
+import time
+import threading
+import collections
+
+class SlidingWindow:
+    '''
+    Allows at most requests calls in any window seconds, across every thread sharing the limiter.
+    Callers reserve a slot and sleep exactly until it is due, so waiting callers are served in order.
+    '''
+    def __init__(self, requests, window):
+        self.window = window
+        self.lock = threading.Lock()
+        self.slots = collections.deque(maxlen=requests)
+        self.stats = {}
+
+    def wait(self, key=None):
+        '''Blocks until the caller may make its request, returns the time spent waiting'''
+        with self.lock:
+            now = time.monotonic()
+            slot = now
+            #The oldest of the last requests slots must have left the window
+            if len(self.slots) == self.slots.maxlen:
+                slot = max(now, self.slots[0] + self.window)
+            self.slots.append(slot)
+            delay = slot - now
+
+            count, waited = self.stats.get(key, (0, 0))
+            self.stats[key] = (count + 1, waited + delay)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    def summary(self):
+        '''Returns {key: (requests, seconds spent waiting)}'''
+        with self.lock:
+            return dict(self.stats)
@@ -3,10 +3,14 @@ import os
 import html
 import json
 import time
+import threading
+import unicodedata
 import logging
 import requests
 
 import utils
+import metrics
+import ratelimit
 
 headers = {
     'Connection': 'keep-alive',
@@ -36,6 +40,14 @@ types = {
     "Unknown": 21
 }
 
+def group_key(name):
+    '''
+    Returns a group or artist name folded for comparison: unescaped, normalized, without accents or punctuation.
+    '''
+    name = unicodedata.normalize('NFKD', utils.normalize(html.unescape(name)))
+    name = "".join(" " if unicodedata.category(c).startswith('P') else c for c in name if not unicodedata.combining(c))
+    return " ".join(name.split())
+
 class LoginException(Exception):
     pass
 
@@ -43,22 +55,23 @@ class RequestException(Exception):
     pass
 
 class RedactedAPI:
-    def __init__(self, api_key=None, logger=None):
+    def __init__(self, api_key=None, logger=None, requests_per_window=5, window=10.0, artist_ttl=60 * 60, site='https://redacted.ch/'):
         self.session = requests.Session()
         self.session.headers.update(headers)
         self.api_key = api_key
+        self.site = site
         self.authkey = None
         self.passkey = None
         self.tracker = "https://flacsfor.me/"
-        self.last_request = time.time()
-        self.rate_limit = 2.0
+        self.limiter = ratelimit.SlidingWindow(requests_per_window, window)
         self.logger = logger
+        self.artist_ttl = artist_ttl
+        self.artist_cache = {}
+        self.artist_lock = threading.Lock()
         self._login()
 
     def _login(self):
         '''Logs in user using API key'''
-        mainpage = 'https://redacted.ch/'
-
         self.session.headers.update(Authorization=self.api_key)
         try:
             accountinfo = self.request('index')
@@ -69,14 +82,17 @@ class RedactedAPI:
 
     def request(self, action, **kwargs):
         '''Makes an AJAX request at a given action page'''
-        while time.time() - self.last_request < self.rate_limit:
-            time.sleep(0.1)
+        delay = self.limiter.wait(action)
+        if delay:
+            metrics.count("throttled_requests_total", service="redacted")
+            metrics.count("throttle_seconds_total", delay, service="redacted")
 
-        ajaxpage = 'https://redacted.ch/ajax.php'
+        ajaxpage = self.site + 'ajax.php'
         params = {'action': action}
         params.update(kwargs)
-        r = self.session.get(ajaxpage, params=params, allow_redirects=False)
-        self.last_request = time.time()
+        with metrics.timer("request_seconds", service="redacted", kind=action):
+            r = self.session.get(ajaxpage, params=params, allow_redirects=False)
+        metrics.count("response_bytes_total", len(r.content), service="redacted")
         if r.status_code == 404:
             return {}
         try:
@@ -88,41 +104,36 @@ class RedactedAPI:
             print(r.status_code)
             raise RequestException
 
-    def get_artist(self, artist=None, format=None):
-        '''Get all releases for a given artist'''
+    def artist_index(self, artist):
+        '''
+        Returns {group key: set of FLAC encodings} for an artist's torrent groups, fetching the artist at most once per artist_ttl.
+        '''
+        key = group_key(artist)
+        with self.artist_lock:
+            cached = self.artist_cache.get(key)
+            if cached and time.time() - cached[0] < self.artist_ttl:
+                return cached[1]
+
+        index = {}
         res = self.request('artist', artistname=artist)
-        if 'torrentgroup' not in res:
-            return {'torrentgroup': []}
-        torrentgroups = res['torrentgroup']
-        keep_releases = []
-        for release in torrentgroups:
-            #Remove Unicode Chars
-            name = html.unescape(release['groupName']).encode('ascii', 'ignore')
-            release['groupName'] = name.decode("utf-8")
-            keeptorrents = []
-            for t in release['torrent']:
-                if not format or t['format'] == format:
-                    keeptorrents.append(t)
-            release['torrent'] = list(keeptorrents)
-            if len(release['torrent']):
-                keep_releases.append(release)
-        res['torrentgroup'] = keep_releases
-        return res
+        for group in res.get('torrentgroup', []):
+            encodings = index.setdefault(group_key(group['groupName']), set())
+            encodings.update(t['encoding'] for t in group['torrent'] if t['format'] == "FLAC")
+
+        with self.artist_lock:
+            self.artist_cache[key] = (time.time(), index)
+        return index
+
+    def forget_artist(self, artist):
+        with self.artist_lock:
+            self.artist_cache.pop(group_key(artist), None)
 
     def is_duplicate(self, release):
         artist = release['artist']
         if 'artists' in release and len(release['artists']):
             artist = release['artists'][0]
 
-        group = self.get_artist(artist=artist, format="FLAC")
-        for result in group['torrentgroup']:
-            if result['groupName'] == release['album']:
-                for torrent in result['torrent']:
-                    if torrent['format'] == "FLAC" and torrent['encoding'] == release['bitrate']:
-                        return True
-                break
-
-        return False
+        return release['bitrate'] in self.artist_index(artist).get(group_key(release['album']), ())
 
     def upload(self, torrent, release):
         upload = {}
@@ -161,7 +172,13 @@ class RedactedAPI:
 
         files = {'file_input': open(torrent, 'rb')}
 
-        r = self.session.post('https://redacted.ch/ajax.php?action=upload', data=upload, files=files)
+        with metrics.timer("request_seconds", {"album": release['album']}, service="redacted", kind="upload"):
+            r = self.session.post(self.site + 'ajax.php?action=upload', data=upload, files=files)
+
+        #The artists' groups have changed
+        for artist in release.get('artists') or [release['artist']]:
+            self.forget_artist(artist)
+
         return json.loads(r.content)
 
     #We have to use a session cookie here because the API doesn't have a report endpoint
@@ -174,5 +191,5 @@ class RedactedAPI:
         data['proofimages'] = image
         data['extra'] = f"Downloaded from [url={url}]Bandcamp[/url]"
 
-        r = requests.post('https://redacted.ch/reportsv2.php?action=takereport', cookies=cookies, data=data, headers=headers)
+        r = requests.post(self.site + 'reportsv2.php?action=takereport', cookies=cookies, data=data, headers=headers)
         return r.content
\ No newline at end of file
@@ -1,21 +1,32 @@
 #!/usr/bin/env python3
 
 import bandcamp
+import download
+import musicbrainz
+import metrics
+import profiling
+import ptpimg
 import redacted
+import state
 import transcode
 import utils
+import webcache
 
 import re
 import os
 import sys
-import json
+import time
 
 import argparse
 import configparser
 import hashlib
 import shutil
-import urllib.error
-import urllib.request
+import zipfile
+import queue
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import coloredlogs
 import logging
@@ -23,6 +34,7 @@ import verboselogs
 
 import musicbrainzngs
 import mutagen
+import requests
 
 allowed_extensions = [".ac3", ".accurip", ".azw3", ".chm", ".cue", ".djv", ".djvu", ".doc", ".dmg", ".dts", ".epub", ".ffp", ".flac", ".gif", ".htm", ".html", ".jpeg", ".jpg", ".lit", ".log", ".m3u", ".m3u8", ".m4a", ".m4b", ".md5", ".mobi", ".mp3", ".mp4", ".nfo", ".pdf", ".pls", ".png", ".rtf", ".sfv", ".txt"]
 
@@ -59,43 +71,18 @@ logger = logging.getLogger(__name__)
 coloredlogs.DEFAULT_LOG_FORMAT='%(levelname)s %(message)s'
 coloredlogs.install(level='INFO', logger=logger)
 
-def rename_tracks(dir):
-    album = None
-    artist = None
-
-    for root, dirs, files in os.walk(dir):
-        for file in files:
-            file_name, file_extension = os.path.splitext(file)
-            if file_extension not in allowed_extensions:
-                os.remove(os.path.join(root, file))
-            if file_extension == ".flac":
-                file_path = os.path.join(root, file)
-                metadata = mutagen.File(file_path)
-                if not album and not artist:
-                    album = metadata['album'][0]
-                    artist = metadata['artist'][0]
-                new_file = metadata['tracknumber'][0].rjust(2, '0') + " " + utils.clean(metadata['title'][0]) + ".flac"
-                os.rename(file_path, os.path.join(root, new_file))
-
-    return [album, artist]
-
-def rename_dir(dir, artist, album):
-    parent_dir = os.path.dirname(dir)
-    new_dir = os.path.join(parent_dir, utils.clean(artist) + " - " + utils.clean(album) + " [FLAC]")
-    os.rename(dir, new_dir)
-    return new_dir
-
 def search_musicbrainz(release):
-    results = musicbrainzngs.search_releases(artist=release['artist'], release=release['album'], limit=5)
-    for result in results["release-list"]:
+    results = musicbrainz.search_releases(release['artist'], release['album'])
+    for result in results.get("release-list", []):
         for artist in result['artist-credit']:
-            if type(artist) is not 'dict':
+            if not isinstance(artist, dict):
                 continue
-            if artist['name'] == release['artist'] and result['title'] == release['album']:
+            name = artist.get('name', artist['artist']['name'])
+            if name == release['artist'] and result['title'] == release['album']:
                 #Get Release Type
-                logger.info(f"Result: {result['title']} by {artist['name']}")
-                primary_type = result['release-group']['primary-type']
-                secondary_types = result['release-group']['secondary-type-list']
+                logger.info(f"Result: {result['title']} by {name}")
+                primary_type = result['release-group'].get('primary-type')
+                secondary_types = result['release-group'].get('secondary-type-list', [])
                 for release_type in secondary_types:
                     if release_type in types.keys():
                         release['release_type'] = types[release_type]
@@ -106,7 +93,9 @@ def search_musicbrainz(release):
                     else:
                         release['release_type'] = "Album"
                 #Get Record Label / Catalogue Number
-                for label in result['label-info-list']:
+                for label in result.get('label-info-list', []):
+                    if 'label' not in label:
+                        continue
                     release['record_label'] = label['label']['name']
                     if 'catalog-number' in label:
                         release['catalogue_number'] = label['catalog-number']
@@ -207,14 +196,348 @@ def print_release(release):
     print(f"Release Description:\n{release['release_description']}")
     print("-----------------------------------------")
 
+def review_release(release):
+    '''Prompts the user to review a release, returns False if it should be skipped'''
+    while True:
+        print_release(release)
+
+        if not len(make_tagstr(release)):
+            logger.error("No Tags")
+            release['tags'] = input("Enter Tags: ").split(", ")
+            continue
+
+        print("[A]pply, [B]lacklist Tags, [E]dit, [S]kip")
+        option = input("Select an option: ")
+
+        if option == "A":
+            return True
+        elif option == "B":
+            tag_blacklist.extend(input("Tags: ").split(", "))
+        elif option == "E":
+            print("Album, Artist, Year, Title, Type, Label")
+            edit = input("Select an option: ")
+            if edit == "Album":
+                release['album'] = input("Album: ")
+            if edit == "Artist":
+                release['artist'] = input("Artist: ")
+            elif edit == "Year":
+                release['initial_year'] = input("Initial Year: ")
+            elif edit == "Title":
+                release['release_title'] = input("Release Title: ")
+            elif edit == "Type":
+                release['release_type'] = input("Release Type: ")
+                if release['release_type'] == "Compilation":
+                    release['artists'] = input("Artists: ").split(", ")
+                    release['artist'] = "Various Artists"
+            elif edit == "Label":
+                release['record_label'] = input("Record Label: ")
+        elif option == "S":
+            return False
+
+def prepare_release(release_path, data_dir, output_dir, store, config, api, uploader, piece_cache=None, lac_tracks=0, all_spectrograms=False):
+    '''Runs every stage of a release that doesn't need user input, resuming from its last checkpoint'''
+    #Extract Files
+    release_file = os.path.basename(release_path)
+    stage = store.last_stage(release_file)
+    if stage and stage != "downloaded":
+        logger.info(f"Resuming {release_file} after {stage}")
+    extracted = store.get(release_file, "extracted")
+    if extracted and os.path.isdir(extracted['dir']):
+        release_dir, album, artist, manifest = extracted['dir'], extracted['album'], extracted['artist'], extracted['manifest']
+    else:
+        with metrics.timer("stage_seconds", {"release": release_file}, stage="extract"):
+            release_dir, album, artist, manifest = utils.extract_release(release_path, data_dir, allowed_extensions)
+        store.set(release_file, "extracted", {"dir": release_dir, "album": album, "artist": artist, "manifest": manifest})
+
+    #Get Album URL from Bandcamp
+    logger.info(f"Release: {album} by {artist}")
+    if release_file in store:
+        url = store[release_file]
+    else:
+        logger.info(f"Searching Bandcamp for {album}")
+        with metrics.timer("stage_seconds", {"release": release_file}, stage="bandcamp_search"):
+            url = bandcamp.get_album_url(album, artist)
+        if url:
+            store.set_url(release_file, url)
+
+    prepared = {
+        "path": release_path,
+        "dir": release_dir,
+        "album": album,
+        "artist": artist,
+        "url": url,
+        "manifest": manifest,
+        "release": None,
+        "lac_results": {},
+        "spectral_links": [],
+        "torrent": os.path.join(output_dir, f"redcamp_{str(int(hashlib.md5(release_file.encode('utf-8')).hexdigest(), 16))[0:12]}.torrent")
+    }
+
+    #Make Torrent
+    if not (store.get(release_file, "torrent") and os.path.exists(prepared['torrent'])):
+        with metrics.timer("stage_seconds", {"release": release_file}, stage="torrent"):
+            transcode.make_torrent(prepared['torrent'], release_dir, api.tracker, api.passkey, config.get('redacted', 'piece_length', fallback=None), piece_cache)
+        store.set(release_file, "torrent", {"path": prepared['torrent']})
+
+    #Check Lossless
+    lac_results = store.get(release_file, "lac")
+    if lac_results is None:
+        with metrics.timer("stage_seconds", {"release": release_file}, stage="lac"):
+            lac_results = transcode.check_lossless(release_dir, manifest, lac_tracks)
+        store.set(release_file, "lac", lac_results)
+    prepared['lac_results'] = lac_results
+
+    #Generate Spectrograms
+    spectral_links = store.get(release_file, "spectrograms")
+    if spectral_links is None:
+        logger.info(f"Generating Spectrograms for {album}")
+        with metrics.timer("stage_seconds", {"release": release_file}, stage="spectrograms"):
+            spectral_links = transcode.make_spectrograms(release_dir, uploader, manifest, all_spectrograms)
+        store.set(release_file, "spectrograms", spectral_links)
+    prepared['spectral_links'] = spectral_links
+
+    if url:
+        fetch_metadata(prepared, uploader, store)
+    return prepared
+
+def fetch_metadata(prepared, uploader, store=None):
+    '''Fetches the metadata of a prepared release from its URL, resuming from its last checkpoint'''
+    album = prepared['album']
+    release_dir = prepared['dir']
+    manifest = prepared['manifest']
+    release_file = os.path.basename(prepared['path'])
+
+    metadata = store.get(release_file, "metadata") if store else None
+    if metadata and metadata['url'] == prepared['url']:
+        release = metadata['release']
+    else:
+        #Get Album Info from Bandcamp
+        with metrics.timer("stage_seconds", {"release": release_file}, stage="bandcamp_album"):
+            release = bandcamp.get_album_info(prepared['url'])
+        if not release:
+            return
+
+        #Rehost Cover Art
+        try:
+            with metrics.timer("stage_seconds", {"release": release_file}, stage="cover"):
+                release['cover_art'] = uploader.rehost(release['cover_art'])
+        except (requests.RequestException, ptpimg.UploadException):
+            logger.warning(f"Couldn't Rehost Cover Art for {album}")
+
+        #Get Album Info from MusicBrainz
+        logger.info(f"Searching MusicBrainz for {album}")
+        with metrics.timer("stage_seconds", {"release": release_file}, stage="musicbrainz"):
+            search_musicbrainz(release)
+
+        #Guess Release Type
+        if 'release_type' not in release:
+            logger.warning("[WRN] No Release Type. Guessing...")
+            release['release_type'] = guess_type(release)
+
+        #Check Compilation
+        if release['release_type'] == "Compilation" or release['artist'] != prepared['artist']:
+            add_artists(release)
+
+        #Check Bitrate
+        if transcode.is_24bit(release_dir, manifest):
+            release['bitrate'] = "24bit Lossless"
+        else:
+            release['bitrate'] = "Lossless"
+
+        if store:
+            store.set(release_file, "metadata", {"url": prepared['url'], "release": release})
+
+    release['release_description'] = make_release_desc(release, prepared['spectral_links'])
+    prepared['release'] = release
+
+def triage(candidates, api):
+    '''
+    Checks every candidate zip against RED using the tags inside it, before any extraction or lookups.
+    Returns the candidates that aren't known duplicates.
+    '''
+    tagged = []
+    keep = []
+    for release_path in candidates:
+        try:
+            tags = utils.read_release_tags(release_path)
+        except (zipfile.BadZipFile, mutagen.MutagenError):
+            tags = None
+        if tags:
+            tagged.append((release_path, *tags))
+        else:
+            keep.append(release_path)
+
+    #Sorted by artist so each artist is fetched once
+    duplicates = set()
+    for release_path, artist, album, bits_per_sample in sorted(tagged, key=lambda release: redacted.group_key(release[1])):
+        bitrate = "24bit Lossless" if bits_per_sample > 16 else "Lossless"
+        #Keep the release on errors, it is checked again before upload
+        try:
+            duplicate = api.is_duplicate({"artist": artist, "album": album, "bitrate": bitrate})
+        except (redacted.RequestException, requests.RequestException):
+            logger.warning(f"Couldn't Check {album} by {artist} for Duplicates")
+            continue
+        if duplicate:
+            logger.info(f"Duplicate Release: {album} by {artist}. Skipping...")
+            duplicates.add(release_path)
+
+    return [release_path for release_path in candidates if release_path not in duplicates]
+
+def prefetch(candidates, prepare, depth):
+    '''Yields prepare(candidate) in order, preparing up to depth candidates ahead in the background'''
+    if depth < 1:
+        for candidate in candidates:
+            yield prepare(candidate)
+        return
+
+    with ThreadPoolExecutor(max_workers=depth) as executor:
+        pending = deque()
+        for candidate in candidates:
+            pending.append(executor.submit(prepare, candidate))
+            if len(pending) > depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def warn_lossless(prepared):
+    lac_results = {path: result for path, result in prepared['lac_results'].items() if result != "Clean"}
+    for path, result in lac_results.items():
+        logger.warning(f"LAC Reports {os.path.basename(path)} as {result}")
+    if lac_results:
+        logger.warning(f"Please Check Spectrals")
+
+def discard_release(prepared, store, outcome):
+    '''Removes the extracted files and torrent of a release that won't be uploaded'''
+    shutil.rmtree(prepared['dir'], ignore_errors=True)
+    if os.path.exists(prepared['torrent']):
+        os.remove(prepared['torrent'])
+    store.clear(os.path.basename(prepared['path']))
+    metrics.count("releases_total", outcome=outcome)
+
+def upload_release(prepared, api, store, torrent_dir):
+    '''Uploads an approved release unless it's a duplicate, returns its torrent ID or None'''
+    release = prepared['release']
+    release_file = os.path.basename(prepared['path'])
+
+    #Make Tags and Description
+    release['tags'] = make_tagstr(release)
+    release['album_description'] = make_album_desc(release)
+
+    #Check for Duplicate Releases
+    with metrics.timer("stage_seconds", {"release": release_file}, stage="duplicate_check"):
+        duplicate = api.is_duplicate(release)
+    if duplicate:
+        logger.info(f"Duplicate Release: {release['album']}. Skipping...")
+        discard_release(prepared, store, "duplicate")
+        return None
+
+    #Upload to RED
+    with metrics.timer("stage_seconds", {"release": release_file}, stage="upload"):
+        response = api.upload(prepared['torrent'], release)
+
+    if response['status'] == 'failure':
+        logger.error(f"Upload Failed: {response['error']}")
+        discard_release(prepared, store, "failed")
+        return None
+
+    torrentid = response['response']['torrentid']
+    store.set(release_file, "uploaded", {"torrentid": torrentid})
+    store.dequeue(release_file)
+    logger.success(f"Uploaded to https://redacted.ch/torrents.php?torrentid={torrentid}")
+
+    shutil.move(prepared['torrent'], torrent_dir)
+    os.remove(prepared['path'])
+    metrics.count("releases_total", outcome="uploaded")
+    return torrentid
+
+def upload_worker(uploads, api, store, torrent_dir, session_cookie):
+    '''Uploads approved releases from a queue until it yields None'''
+    while True:
+        item = uploads.get()
+        if item is None:
+            return
+        prepared, report = item
+        try:
+            torrentid = upload_release(prepared, api, store, torrent_dir)
+            if torrentid and report:
+                api.report_lossy(session_cookie, torrentid, prepared['spectral_links'][0], prepared['release']['url'])
+        except Exception as e:
+            logger.error(f"Upload of {os.path.basename(prepared['path'])} Failed: {e}")
+
+def review_queue(store, api, uploader, torrent_dir, session_cookie):
+    '''
+    Reviews the releases queued by --unattended, while approved releases are uploaded in the background.
+    Releases approved in an earlier review that didn't finish uploading are uploaded first.
+    '''
+    uploads = queue.Queue()
+    worker = threading.Thread(target=upload_worker, args=(uploads, api, store, torrent_dir, session_cookie))
+    worker.start()
+
+    try:
+        for release_file, prepared, report in store.queued_releases("approved"):
+            uploads.put((prepared, report))
+
+        pending = store.queued_releases("pending")
+        logger.info(f"{len(pending)} Releases to Review")
+        for i, (release_file, prepared, report) in enumerate(pending):
+            logger.info(f"[{i + 1}/{len(pending)}] {release_file}")
+            if not os.path.exists(prepared['path']) or not os.path.isdir(prepared['dir']):
+                logger.warning(f"Files of {release_file} are Missing. Skipping...")
+                store.clear(release_file)
+                continue
+
+            if not prepared['url']:
+                logger.error(f"No Results for {prepared['album']}")
+                prepared['url'] = input("Enter Album URL: ")
+                store.set_url(release_file, prepared['url'])
+                fetch_metadata(prepared, uploader, store)
+                if not prepared['release']:
+                    logger.error("Invalid URL. Skipping...")
+                    discard_release(prepared, store, "invalid_url")
+                    continue
+
+            warn_lossless(prepared)
+
+            with metrics.timer("stage_seconds", {"release": release_file}, stage="review"):
+                approved = review_release(prepared['release'])
+            if not approved:
+                discard_release(prepared, store, "skipped")
+                continue
+
+            report = bool(session_cookie) and input("Report Lossy WEB? [y/n]: ") == "y"
+            store.approve(release_file, prepared, report)
+            uploads.put((prepared, report))
+    finally:
+        uploads.put(None)
+        logger.info("Waiting for Uploads")
+        worker.join()
+
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter, prog='redcamp')
+    parser.add_argument('command', help='run processes new releases, review goes through the releases queued by --unattended', nargs='?', choices=['run', 'review'], default='run')
     parser.add_argument('--config', help='Location of configuration file', default=os.path.expanduser('~/.redcamp/config'))
-    parser.add_argument('--cache', help='Location of cache file', default=os.path.expanduser('~/.redcamp/cache'))
+    parser.add_argument('--state', help='Location of release state database', default=os.path.expanduser('~/.redcamp/state.db'))
+    parser.add_argument('--cache', help='Location of legacy cache file, migrated into the state database', default=os.path.expanduser('~/.redcamp/cache'))
+    parser.add_argument('--http-cache', help='Location of Bandcamp page cache', default=os.path.expanduser('~/.redcamp/http.db'))
+    parser.add_argument('--musicbrainz-cache', help='Location of MusicBrainz lookup cache', default=os.path.expanduser('~/.redcamp/musicbrainz.db'))
+    parser.add_argument('--musicbrainz-index', help='Location of local MusicBrainz index, see musicbrainz.py', default=os.path.expanduser('~/.redcamp/musicbrainz-index.db'))
+    parser.add_argument('--image-cache', help='Location of uploaded image cache', default=os.path.expanduser('~/.redcamp/images'))
+    parser.add_argument('--piece-cache', help='Location of torrent piece hash cache', default=os.path.expanduser('~/.redcamp/pieces'))
     parser.add_argument('--download-releases', help='Download releases from file', action='store_true')
     parser.add_argument('--release-file', help='Location of release file', default=os.path.abspath('./releases.txt'))
+    parser.add_argument('--download-workers', help='Number of concurrent downloads', type=int, default=4)
+    parser.add_argument('--host-connections', help='Maximum concurrent downloads per host', type=int, default=2)
+    parser.add_argument('--lac-tracks', help='Number of tracks to check with Lossless Audio Checker, 0 for all', type=int, default=0)
+    parser.add_argument('--all-spectrograms', help='Make spectrograms for every track instead of the first', action='store_true')
+    parser.add_argument('--metrics-log', help='Append a JSON line for every timed stage and request to this file')
+    parser.add_argument('--metrics-textfile', help='Write Prometheus metrics to this file, for the node exporter textfile collector')
+    parser.add_argument('--profile', help='Profile each release with cProfile and tracemalloc, implies --prefetch 0', action='store_true')
+    parser.add_argument('--profile-dir', help='Directory for profile reports', default=os.path.expanduser(os.path.join('~/.redcamp/profiles', time.strftime('%Y%m%d-%H%M%S'))))
+    parser.add_argument('--unattended', help='Queue prepared releases for review with "redcamp review" instead of prompting', action='store_true')
+    parser.add_argument('--prefetch', help='Number of releases to prepare in the background while reviewing', type=int, default=2)
 
     args = parser.parse_args()
+    metrics.configure(args.metrics_log, args.metrics_textfile)
     config = configparser.RawConfigParser()
 
     try:
@@ -229,7 +552,9 @@ def main():
         config.set('redacted', 'data_dir', '')
         config.set('redacted', 'output_dir', '')
         config.set('redacted', 'torrent_dir', '')
-        config.set('redacted', 'piece_length', '18')
+        config.set('redacted', 'piece_length', '')
+        config.set('redacted', 'requests_per_window', '5')
+        config.set('redacted', 'request_window', '10')
         config.add_section('ptpimg')
         config.set('ptpimg', 'api_key', '')
         config.write(open(args.config, 'w'))
@@ -240,44 +565,16 @@ def main():
     output_dir = os.path.expanduser(config.get('redacted', 'output_dir'))
     torrent_dir = os.path.expanduser(config.get('redacted', 'torrent_dir'))
 
-    #Read Cache
-    cache = utils.read_file(args.cache)
-    if cache:
-        cache = json.loads(cache)
-    else:
-        cache = {}
+    #Open State
+    store = state.StateStore(args.state)
+    if os.path.exists(args.cache):
+        logger.info(f"Migrated {store.migrate(args.cache)} Releases from {args.cache}")
 
     #Download Releases
     if args.download_releases:
-        for release in utils.read_file(args.release_file).strip().split("\n"):
-            release_url, download_link = release.split(", ")
-
-            try:
-                response = urllib.request.urlopen(download_link)
-            except urllib.error.HTTPError:
-                logger.error(f"Invalid URL. Skipping...")
-                continue
-
-            file_name = response.info().get_filename().encode('latin-1').decode('utf-8')
-            file_path = os.path.join(output_dir, file_name)
-
-            if os.path.exists(file_path):
-                continue
-
-            while True:
-                try:
-                    logger.info(f"Downloading Release: {file_name}")
-                    urllib.request.urlretrieve(download_link, file_path)
-                    break
-                except urllib.error.ContentTooShortError:
-                    logger.error("Download Error. Restarting...")
-                    os.remove(file_path)
-                    continue
-
-            cache[file_name] = release_url
-
-    #Write Cache
-    utils.write_file(args.cache, json.dumps(cache, indent=4, sort_keys=True))
+        releases = [release.split(", ") for release in utils.read_file(args.release_file).strip().split("\n") if release]
+        downloader = download.Downloader(output_dir, store, args.download_workers, args.host_connections, logger)
+        downloader.run(releases)
 
     api_key = config.get('redacted', 'api_key')
 
@@ -286,158 +583,114 @@ def main():
     except configparser.NoOptionError:
         session_cookie = None
 
+    bandcamp.session = webcache.CachedSession(args.http_cache)
+
     logger.info("Logging in to RED")
-    api = redacted.RedactedAPI(api_key, logger)
+    api = redacted.RedactedAPI(api_key, logger, config.getint('redacted', 'requests_per_window', fallback=5), config.getfloat('redacted', 'request_window', fallback=10.0))
+
+    uploader = ptpimg.PtpimgUploader(config.get('ptpimg', 'api_key'), args.image_cache, logger=logger)
 
     logger.info("Logging in to MusicBrainz")
     musicbrainzngs.set_useragent("REDCamp", "1.0", "https://github.com/TrackerTools/REDCamp")
+    musicbrainz.set_cache(args.musicbrainz_cache)
+    musicbrainz.set_index(args.musicbrainz_index)
+
+    if args.command == "review":
+        review_queue(store, api, uploader, torrent_dir, session_cookie)
+        metrics.close()
+        return
 
     #Get Candidates
     logger.info("Getting Candidates")
     candidates = []
     for root, dirs, files in os.walk(output_dir):
         for file in files:
-            if (re.match(r'^(.+) - (.+).zip$', file)):
-                candidates.append(os.path.join(root, file))
-
-    for release_path in candidates:
-        #Unzip File
-        release_file = os.path.basename(release_path)
-        release_dir = utils.unzip_file(release_path, data_dir)
-
-        #Rename Files
-        album, artist = rename_tracks(release_dir)
-        
-        #Rename Directory
-        release_dir = rename_dir(release_dir, artist, album)
+            if not re.match(r'^(.+) - (.+).zip$', file):
+                continue
+            if store.get(file, "uploaded"):
+                logger.info(f"Already Uploaded {file}. Removing...")
+                os.remove(os.path.join(root, file))
+                continue
+            if store.queued(file):
+                continue
+            candidates.append(os.path.join(root, file))
+
+    logger.info(f"Checking {len(candidates)} Candidates for Duplicates")
+    with metrics.timer("stage_seconds", {"candidates": len(candidates)}, stage="triage"):
+        candidates = triage(candidates, api)
+
+    #Profile Releases One at a Time
+    profiler = None
+    if args.profile:
+        profiler = profiling.Profiler(args.profile_dir)
+        args.prefetch = 0
+
+    def prepare(release_path):
+        if profiler:
+            profiler.begin(release_path)
+        #One broken release shouldn't stop the rest of the run
+        try:
+            return prepare_release(release_path, data_dir, output_dir, store, config, api, uploader, args.piece_cache, args.lac_tracks, args.all_spectrograms)
+        except Exception:
+            logger.exception(f"Failed to Prepare {os.path.basename(release_path)}. Skipping...")
+            metrics.count("releases_total", outcome="failed")
+            return None
+
+    for prepared in prefetch(candidates, prepare, args.prefetch):
+        #Reports cover preparation only, not time spent waiting on the user
+        if profiler:
+            profiler.end()
+        metrics.write_textfile()
+        if not prepared:
+            continue
+        release_file = os.path.basename(prepared['path'])
 
-        #Get Album Info from Bandcamp
-        logger.info(f"Release: {album} by {artist}")
-        if release_file in cache:
-            url = cache[release_file]
-        else:
-            logger.info(f"Searching Bandcamp for {album}")
-            url = bandcamp.get_album_url(album, artist)
-        if not url:
-            logger.error(f"No Results for {album}")
-            url = input("Enter Album URL: ")
+        if not prepared['url']:
+            logger.error(f"No Results for {prepared['album']}")
+            if args.unattended:
+                store.enqueue(release_file, prepared)
+                continue
+            prepared['url'] = input("Enter Album URL: ")
+            store.set_url(release_file, prepared['url'])
+            fetch_metadata(prepared, uploader, store)
 
-        release = bandcamp.get_album_info(url)
+        release = prepared['release']
         if not release:
             logger.error("Invalid URL. Skipping...")
-            shutil.rmtree(release_dir)
+            discard_release(prepared, store, "invalid_url")
             continue
 
-        #Get Album Info from MusicBrainz
-        logger.info(f"Searching MusicBrainz for {album}")
-        search_musicbrainz(release)
-
-        #Guess Release Type
-        if 'release_type' not in release:
-            logger.warning("[WRN] No Release Type. Guessing...")
-            release['release_type'] = guess_type(release)
-
-        #Check Compilation
-        if release['release_type'] == "Compilation" or release['artist'] != artist:
-            add_artists(release)
-
-        #Check Bitrate
-        if transcode.is_24bit(release_dir):
-            release['bitrate'] = "24bit Lossless"
-        else:
-            release['bitrate'] = "Lossless"
-
-        #Check Lossless
-        result = transcode.is_lossless(release_dir)
-        if result != "Clean":
-            logger.warning(f"LAC Reports Release as {result}")
-            logger.warning(f"Please Check Spectrals")
-
-        #Generate Spectrograms
-        logger.info("Generating Spectrograms")
-        spectral_links = transcode.make_spectrograms(release_dir, config.get('ptpimg', 'api_key'))
-        release['release_description'] = make_release_desc(release, spectral_links)
-
-        #Review Release
-        skip = False
-
-        while True:
-            print_release(release)
-
-            if not len(make_tagstr(release)):
-                logger.error("No Tags")
-                release['tags'] = input("Enter Tags: ").split(", ")
-                continue
-
-            print("[A]pply, [B]lacklist Tags, [E]dit, [S]kip")
-            option = input("Select an option: ")
-
-            if option == "A":
-                break
-            elif option == "B":
-                tag_blacklist.extend(input("Tags: ").split(", "))
-            elif option == "E":
-                print("Album, Artist, Year, Title, Type, Label")
-                edit = input("Select an option: ")
-                if edit == "Album":
-                    release['album'] = input("Album: ")
-                if edit == "Artist":
-                    release['artist'] = input("Artist: ")
-                elif edit == "Year":
-                    release['initial_year'] = input("Initial Year: ")
-                elif edit == "Title":
-                    release['release_title'] = input("Release Title: ")
-                elif edit == "Type":
-                    release['release_type'] = input("Release Type: ")
-                    if release['release_type'] == "Compilation":
-                        release['artists'] = input("Artists: ").split(", ")
-                        release['artist'] = "Various Artists"
-                elif edit == "Label":
-                    release['record_label'] = input("Record Label: ")
-            elif option == "S":
-                skip = True
-                break
-
-        if skip:
-            shutil.rmtree(release_dir)
+        if args.unattended:
+            logger.info(f"Queued {release_file} for Review")
+            store.enqueue(release_file, prepared)
             continue
 
-        #Make Tags and Description
-        release['tags'] = make_tagstr(release)
-        release['album_description'] = make_album_desc(release)
+        warn_lossless(prepared)
 
-        #Check for Duplicate Releases
-        if api.is_duplicate(release):
-            logger.info("Duplicate Release. Skipping...")
-            shutil.rmtree(release_dir)
-            break
-
-        #Make Torrent
-        torrent = os.path.join(output_dir, f"redcamp_{str(int(hashlib.md5(release_file.encode('utf-8')).hexdigest(), 16))[0:12]}.torrent")
-        if not os.path.exists(torrent):
-            transcode.make_torrent(torrent, release_dir, api.tracker, api.passkey, config.get('redacted', 'piece_length'))
-
-        #Upload to RED
-        response = api.upload(torrent, release)
-        
-        if response['status'] == 'failure':
-            logging.error(f"Upload Failed: {response['error']}")
-            shutil.rmtree(release_dir)
-            os.remove(torrent)
+        #Review Release
+        with metrics.timer("stage_seconds", {"release": release_file}, stage="review"):
+            approved = review_release(release)
+        if not approved:
+            discard_release(prepared, store, "skipped")
             continue
 
-        torrentid = response['response']['torrentid']
-        logger.success(f"Uploaded to https://redacted.ch/torrents.php?torrentid={torrentid}")
-
-        shutil.move(torrent, torrent_dir)
+        torrentid = upload_release(prepared, api, store, torrent_dir)
 
         #Report Lossy WEB
-        if session_cookie:
+        if torrentid and session_cookie:
             option = input("Report Lossy WEB? [y/n]: ")
             if option == "y":
-                api.report_lossy(session_cookie, torrentid, spectral_links[0], release['url'])
+                api.report_lossy(session_cookie, torrentid, prepared['spectral_links'][0], release['url'])
+
+    #Rate Limit Summary
+    for name, limiter in (("RED", api.limiter), ("MusicBrainz", musicbrainz.limiter)):
+        for endpoint, (count, waited) in sorted(limiter.summary().items()):
+            logger.info(f"{name} {endpoint}: {count} requests, {waited:.1f}s waiting on rate limit")
+
+    metrics.close()
 
-        os.remove(release_path)
+    if profiler:
+        logger.info(f"Profile Summary: {profiler.finish()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,24 +1,43 @@
+import os
 import sys
+import json
 import time
+import queue
+import argparse
+import requests
+import threading
+
+import bandcamp
 import utils
+import seen
+import webcache
 
 from os import path
 from datetime import datetime
-from urllib.parse import urlparse
+from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor
 
-import geckodriver_autoinstaller
+#Selenium is only needed for the download handshake and --browser
+try:
+    import geckodriver_autoinstaller
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import NoSuchElementException
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import ElementNotInteractableException
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.firefox.options import Options
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import NoSuchElementException
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import ElementNotInteractableException
+    from selenium.common.exceptions import TimeoutException, WebDriverException
+except ImportError:
+    webdriver = None
 
 blacklisted_tags = ["noise", "noisegrind", "harsh.noise"]
 cutoff_year = 2019
 
+#Bandcamp's discover data for new digital releases, {page} is the page number
+discover_url = "https://bandcamp.com/api/discover/3/get_web?g=all&s=new&p={page}&gn=0&f=digital&w=0"
+
 def get_download_link(driver):
     driver.find_element_by_class_name("download-link.buy-link").click()
     driver.find_element_by_id("userPrice").send_keys("0")
@@ -37,22 +56,161 @@ def get_download_link(driver):
     )
     return element.get_attribute("href")
 
-def main():
-    release_ct = int(input("Number of Releases: "))
-
-    cache = utils.read_file("./cache.txt")
-    if cache:
-        cache = cache.split("\n")
+def item_url(item, page_url):
+    '''
+    Returns the release URL of a discover item, without any query string.
+    '''
+    if item.get('tralbum_url'):
+        url = urljoin(page_url, item['tralbum_url'])
+    elif item.get('url_hints'):
+        hints = item['url_hints']
+        host = hints.get('custom_domain') or f"{hints['subdomain']}.bandcamp.com"
+        url = f"https://{host}/{'track' if hints.get('item_type') == 't' else 'album'}/{hints['slug']}"
     else:
-        cache = []
+        return None
+    parsed_url = urlparse(url)
+    return parsed_url.scheme + "://" + parsed_url.netloc + parsed_url.path
+
+def discover(session, url=discover_url):
+    '''
+    Yields lists of release URLs from Bandcamp's discover data, one page at a time.
+    '''
+    page = 0
+    while True:
+        page_url = url.format(page=page)
+        data = json.loads(session.get(page_url, ttl=0))
+        items = data.get('items', [])
+        yield [url for url in (item_url(item, page_url) for item in items) if url]
+        if not items or not data.get('more_available', True):
+            return
+        page += 1
+
+def matches_filters(session, url):
+    '''
+    Returns True if the release at url is name your price, released after cutoff_year and has no blacklisted tags.
+    '''
+    try:
+        page = session.get(url)
+    except requests.RequestException:
+        return False
+
+    try:
+        album = bandcamp.extract_album(page, url) or bandcamp.soup_album(page, url)
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+    if any(tag in blacklisted_tags for tag in album['tags']):
+        return False
+    return album['release_year'] >= cutoff_year and bandcamp.is_name_your_price(page)
+
+def discover_http(session, release_ct, seen_urls, url=discover_url, workers=8):
+    '''
+    Pages through the discover data and checks release pages over HTTP, returns up to release_ct matching URLs.
+    '''
+    matches = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for urls in discover(session, url):
+            urls = [url for url in dict.fromkeys(urls) if url not in seen_urls]
+            futures = [executor.submit(matches_filters, session, url) for url in urls]
+
+            #Only releases whose result is used are marked seen, the rest are checked again next time
+            for url, future in zip(urls, futures):
+                if len(matches) >= release_ct:
+                    future.cancel()
+                    continue
+                seen_urls.add(url)
+                if future.result():
+                    print(f"Match: {url}")
+                    matches.append(url)
+            if len(matches) >= release_ct:
+                break
+    return matches
+
+def install_driver():
+    if webdriver is None:
+        sys.exit("Selenium and geckodriver_autoinstaller are needed to get download links")
 
     #Install geckodriver
     geckodriver_autoinstaller.install()
 
+def make_driver():
     options = Options()
     options.headless = True
-    driver = webdriver.Firefox(options=options)
+    return webdriver.Firefox(options=options)
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
 
+def download_worker(urls, links, recycle_after, retries=1):
+    '''
+    Gets download links for URLs from a queue with its own Firefox, restarted every recycle_after pages and after a crash.
+    '''
+    driver = None
+    pages = 0
+    try:
+        while True:
+            try:
+                url, attempt = urls.get_nowait()
+            except queue.Empty:
+                break
+
+            try:
+                if driver is None:
+                    driver = make_driver()
+                    pages = 0
+                driver.get(url)
+                pages += 1
+                download_link = get_download_link(driver)
+                if download_link:
+                    print(f"Download Link: {url}")
+                    links[url] = download_link
+            except (NoSuchElementException, ElementNotInteractableException, TimeoutException):
+                print(f"No Download Link: {url}")
+            except WebDriverException:
+                #Firefox crashed or hung, start a new one and retry
+                print(f"Browser Error: {url}")
+                if driver:
+                    quit_driver(driver)
+                driver = None
+                if attempt < retries:
+                    urls.put((url, attempt + 1))
+            except Exception as e:
+                print(f"Error: {url} ({e!r})")
+
+            if driver and pages >= recycle_after:
+                quit_driver(driver)
+                driver = None
+    finally:
+        #Never leave a Firefox running behind the thread
+        if driver:
+            quit_driver(driver)
+
+def get_download_links(urls, workers=4, recycle_after=25):
+    '''
+    Gets the download links of several releases with a pool of Firefox workers, returns (URL, download link) pairs in order.
+    '''
+    install_driver()
+
+    pending = queue.Queue()
+    for url in urls:
+        pending.put((url, 0))
+
+    links = {}
+    threads = [threading.Thread(target=download_worker, args=(pending, links, recycle_after)) for _ in range(min(workers, len(urls)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return [(url, links[url]) for url in urls if url in links]
+
+def discover_browser(driver, release_ct, seen_urls):
+    '''
+    Finds matching releases by driving the Bandcamp discover page, returns (URL, download link) pairs.
+    '''
     #Load Bandcamp
     driver.get("https://bandcamp.com")
     driver.implicitly_wait(2)
@@ -77,10 +235,9 @@ def main():
             parsed_url = urlparse(album.get_attribute("href"))
             url = parsed_url.scheme + "://" + parsed_url.netloc + parsed_url.path
 
-            #Check Cache
-            if url in cache:
+            #Check Seen URLs
+            if not seen_urls.add(url):
                 continue
-            cache.append(url)
 
             #Open New Tab
             driver.execute_script("window.open('');")
@@ -108,7 +265,7 @@ def main():
                     download_link = get_download_link(driver)
                     if download_link:
                         print(f"Match: {url}")
-                        releases.append(f"{url}, {download_link}")
+                        releases.append((url, download_link))
             except NoSuchElementException:
                 pass
             
@@ -119,10 +276,46 @@ def main():
             #Load Next Page of Releases
             WebDriverWait(driver, 5).until(EC.element_to_be_clickable((By.XPATH, "//a[@class='item-page' and text()='next']"))).click()
 
-    driver.close()
+    return releases
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter, prog='scrape')
+    parser.add_argument('--releases', help='Number of releases to find', type=int)
+    parser.add_argument('--browser', help='Find releases through the discover page in Firefox instead of over HTTP', action='store_true')
+    parser.add_argument('--discover-url', help='Discover data URL, {page} is replaced with the page number', default=discover_url)
+    parser.add_argument('--http-cache', help='Location of Bandcamp page cache', default=os.path.expanduser('~/.redcamp/http.db'))
+    parser.add_argument('--workers', help='Number of release pages to fetch at once', type=int, default=8)
+    parser.add_argument('--browsers', help='Number of Firefox instances getting download links at once', type=int, default=4)
+    parser.add_argument('--recycle-after', help='Restart each Firefox instance after this many releases', type=int, default=25)
+    parser.add_argument('--seen-file', help='Location of the list of release URLs already checked', default='./cache.txt')
+    parser.add_argument('--bloom-filter', help='Location of an optional Bloom filter of the seen URLs, for large lists')
+    parser.add_argument('--bloom-size', help='Size of the Bloom filter in MiB', type=int, default=16)
+    parser.add_argument('--list-only', help='Print matching releases without getting their download links', action='store_true')
+    args = parser.parse_args()
+
+    release_ct = args.releases or int(input("Number of Releases: "))
+
+    seen_urls = seen.SeenStore(args.seen_file, args.bloom_filter, args.bloom_size * 2**20, read_only=args.list_only)
+
+    if args.browser:
+        install_driver()
+        driver = make_driver()
+        releases = discover_browser(driver, release_ct, seen_urls)
+        driver.close()
+    else:
+        if not path.exists(path.dirname(args.http_cache)):
+            os.makedirs(path.dirname(args.http_cache))
+        session = webcache.CachedSession(args.http_cache, pool_size=args.workers)
+        urls = discover_http(session, release_ct, seen_urls, args.discover_url, args.workers)
+
+        #The free download handshake still needs a browser
+        releases = []
+        if urls and not args.list_only:
+            releases = get_download_links(urls, args.browsers, args.recycle_after)
 
-    utils.write_file("./releases.txt", "\n".join(releases))
-    utils.write_file("./cache.txt", "\n".join(cache))
+    if not args.list_only:
+        utils.write_file("./releases.txt", "\n".join(f"{url}, {download_link}" for url, download_link in releases))
+    seen_urls.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,138 @@
+import os
+import mmap
+import hashlib
+import threading
+
+def digest(url):
+    return hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+
+class BloomFilter:
+    '''
+    A Bloom filter in a memory mapped file. The first 8 bytes record the size of the log it was built from.
+    '''
+    def __init__(self, path, size=16 * 2**20, hashes=7):
+        self.hashes = hashes
+        created = not os.path.exists(path) or os.path.getsize(path) != 8 + size
+        with open(path, 'a+b') as file:
+            file.truncate(8 + size)
+        self.file = open(path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 8 + size)
+        self.bits = size * 8
+        if created:
+            self.map[:] = bytes(8 + size)
+
+    def _positions(self, key):
+        first = int.from_bytes(key[:8], 'little')
+        second = int.from_bytes(key[8:], 'little') | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.map[8 + position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, key):
+        return all(self.map[8 + position // 8] & (1 << (position % 8)) for position in self._positions(key))
+
+    def clear(self):
+        self.map[:] = bytes(len(self.map))
+
+    @property
+    def log_size(self):
+        return int.from_bytes(self.map[:8], 'little')
+
+    @log_size.setter
+    def log_size(self, size):
+        self.map[:8] = size.to_bytes(8, 'little')
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+class SeenStore:
+    '''
+    The set of release URLs the scraper has already checked, kept as an append-only file with one URL per line.
+    URLs are held in memory as fixed size digests and appended to the file as they are added, so a crash loses nothing.
+    With a Bloom filter, new URLs are answered from the filter alone and the file is only read to confirm a possible match.
+    '''
+    def __init__(self, path, bloom_path=None, bloom_size=16 * 2**20, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.lock = threading.Lock()
+        self.digests = None
+        self.bloom = BloomFilter(bloom_path, bloom_size) if bloom_path else None
+
+        #Rebuild the filter if the file changed without it
+        if self.bloom and self.bloom.log_size != self._log_size():
+            self.bloom.clear()
+            for url in self._read():
+                self.bloom.add(digest(url))
+            self.bloom.log_size = self._log_size()
+        if not self.bloom or read_only:
+            self._load()
+
+        self.file = None
+        if not read_only:
+            #Older files may not end with a newline
+            needs_newline = self._log_size() and self._last_byte() != b"\n"
+            self.file = open(path, 'a', encoding='utf-8')
+            if needs_newline:
+                self.file.write("\n")
+                self.file.flush()
+
+    def _log_size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def _last_byte(self):
+        with open(self.path, 'rb') as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as file:
+            for line in file:
+                line = line.strip()
+                if line:
+                    yield line
+
+    def _load(self):
+        if self.digests is None:
+            self.digests = {digest(url) for url in self._read()}
+
+    def __contains__(self, url):
+        key = digest(url)
+        with self.lock:
+            if self.bloom and key not in self.bloom:
+                return False
+            self._load()
+            return key in self.digests
+
+    def add(self, url):
+        '''Records a URL, returns False if it had already been seen'''
+        key = digest(url)
+        with self.lock:
+            if self.bloom and key in self.bloom:
+                self._load()
+            if self.digests is not None:
+                if key in self.digests:
+                    return False
+                self.digests.add(key)
+            if self.read_only:
+                return True
+
+            #Filter first, so a crash can only leave a false positive
+            if self.bloom:
+                self.bloom.add(key)
+            self.file.write(url + "\n")
+            self.file.flush()
+            if self.bloom:
+                self.bloom.log_size = self._log_size()
+            return True
+
+    def close(self):
+        if self.file:
+            self.file.close()
+        if self.bloom:
+            self.bloom.close()
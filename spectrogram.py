@@ -0,0 +1,155 @@
+import io
+import os
+import math
+import subprocess
+import multiprocessing
+
+import numpy
+
+from PIL import Image, ImageDraw, ImageFont
+from concurrent.futures import ProcessPoolExecutor
+
+#Same settings as mkspectrograms.sh
+full_size = (3000, 513)
+zoom_size = (500, 1025)
+dynamic_range = 120
+zoom_start = 3
+zoom_total = 2
+zoom_title_length_limit = 85
+
+#Frames averaged into each column at most
+max_frames = 8
+
+margin_left = 58
+margin_right = 92
+margin_top = 30
+margin_bottom = 44
+
+def decode(flac_file):
+    '''
+    Decodes the first channel of a FLAC to float32 samples, like sox's "remix 1".
+    '''
+    command = ["ffmpeg", "-v", "error", "-i", flac_file, "-map", "0:a:0", "-af", "pan=mono|c0=c0", "-f", "f32le", "-"]
+    output = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+    return numpy.frombuffer(output, dtype=numpy.float32)
+
+def palette():
+    '''
+    Returns sox's default spectrogram palette as a 256 x 3 array.
+    '''
+    x = numpy.linspace(0, 1, 256)
+    r = numpy.where(x < .13, 0, numpy.where(x < .73, numpy.sin((x - .13) / .60 * math.pi / 2), 1))
+    g = numpy.where(x < .60, 0, numpy.where(x < .91, numpy.sin((x - .60) / .31 * math.pi / 2), 1))
+    b = numpy.where(x < .60, .5 * numpy.sin(x / .60 * math.pi), numpy.where(x < .78, 0, (x - .78) / .22))
+    return (numpy.stack([r, g, b], axis=1).clip(0, 1) * 255).astype(numpy.uint8)
+
+def stft_db(samples, columns, rows, start=0, end=None):
+    '''
+    Returns a rows x columns array of levels in dBFS for samples[start:end], clipped to the dynamic range.
+    Each column averages up to max_frames Kaiser-windowed DFTs spread across its share of the samples.
+    '''
+    end = len(samples) if end is None else min(end, len(samples))
+    dft_size = 2 * (rows - 1)
+    window = numpy.kaiser(dft_size, 0.1102 * (dynamic_range - 8.7)).astype(numpy.float32)
+    scale = (window.sum() / 2) ** 2
+
+    step = (end - start) / columns
+    frames = int(max(1, min(max_frames, step // dft_size)))
+    offsets = start + (numpy.arange(frames) + 0.5) * step / frames - dft_size / 2
+
+    levels = numpy.empty((columns, rows), numpy.float32)
+    chunk = max(1, 2**22 // (frames * dft_size))
+    for first in range(0, columns, chunk):
+        column = numpy.arange(first, min(first + chunk, columns))
+        positions = (column[:, None] * step + offsets[None, :]).astype(numpy.int64)
+        indices = positions[:, :, None] + numpy.arange(dft_size)
+
+        #Clip the indices rather than padding a copy of the track, and zero anything outside it
+        blocks = samples[indices.clip(0, len(samples) - 1)]
+        blocks[(indices < 0) | (indices >= len(samples))] = 0
+        blocks *= window
+        power = (numpy.abs(numpy.fft.rfft(blocks, axis=-1)) ** 2).mean(axis=1)
+        levels[first:first + len(column)] = 10 * numpy.log10(power / scale + 1e-30)
+
+    return levels.clip(-dynamic_range, 0).T[::-1]
+
+def render(levels, sample_rate, start, duration, title, caption):
+    '''
+    Draws the spectrogram with a title, axes, a dB scale and a caption, and returns the PNG bytes.
+    '''
+    rows, columns = levels.shape
+    colours = palette()[((levels + dynamic_range) / dynamic_range * 255).astype(numpy.uint8)]
+
+    width = margin_left + columns + margin_right
+    height = margin_top + rows + margin_bottom
+    image = Image.new("RGB", (width, height), (0, 0, 0))
+    image.paste(Image.fromarray(colours, "RGB"), (margin_left, margin_top))
+
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    white = (255, 255, 255)
+    grey = (140, 140, 140)
+
+    draw.rectangle([margin_left - 1, margin_top - 1, margin_left + columns, margin_top + rows], outline=grey)
+    draw.text((width // 2, margin_top // 2), title, fill=white, font=font, anchor="mm")
+    draw.text((4, height - 14), caption, fill=white, font=font)
+
+    #Frequency Axis
+    nyquist = sample_rate / 2
+    khz_step = max(1, int(nyquist / 1000 / 12))
+    for khz in range(0, int(nyquist / 1000) + 1, khz_step):
+        y = margin_top + rows - 1 - int(khz * 1000 / nyquist * (rows - 1))
+        draw.line([margin_left - 5, y, margin_left - 1, y], fill=grey)
+        draw.text((margin_left - 8, y), str(khz), fill=white, font=font, anchor="rm")
+    draw.text((margin_left - 8, margin_top - 10), "kHz", fill=white, font=font, anchor="rm")
+
+    #Time Axis
+    seconds_step = next((step for step in (0.1, 0.2, 0.5, 1, 2, 5, 10, 15, 30, 60, 120, 300, 600) if duration / step <= 15), 1200)
+    tick = math.ceil(start / seconds_step) * seconds_step
+    while tick <= start + duration:
+        x = margin_left + int((tick - start) / duration * (columns - 1))
+        draw.line([x, margin_top + rows, x, margin_top + rows + 4], fill=grey)
+        label = f"{int(tick) // 60}:{int(tick) % 60:02d}" if seconds_step >= 1 else f"{tick:.1f}"
+        draw.text((x, margin_top + rows + 6), label, fill=white, font=font, anchor="mt")
+        tick += seconds_step
+
+    #dB Scale
+    bar_left = margin_left + columns + 12
+    bar = numpy.repeat(palette()[::-1][:, None, :], 12, axis=1)
+    image.paste(Image.fromarray(bar, "RGB").resize((12, rows)), (bar_left, margin_top))
+    for db in range(0, dynamic_range + 1, 10):
+        y = margin_top + int(db / dynamic_range * (rows - 1))
+        draw.text((bar_left + 16, y), f"-{db}" if db else "0", fill=white, font=font, anchor="lm")
+    draw.text((bar_left + 16, margin_top - 10), "dBFS", fill=white, font=font, anchor="lm")
+
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", optimize=False)
+    return buffer.getvalue()
+
+def make_spectrograms(track, title):
+    '''
+    Decodes a track once and returns the full and zoomed spectrograms as [(file name, PNG bytes)].
+    track is a manifest entry.
+    '''
+    samples = decode(track['path'])
+    sample_rate = track['sample_rate']
+    duration = len(samples) / sample_rate
+    name = os.path.splitext(os.path.basename(track['path']))[0]
+    info = f"         {track['bits_per_sample']} bit  |  {sample_rate} Hz"
+
+    full = render(stft_db(samples, *full_size), sample_rate, 0, duration, title, f"{info}  |  {int(duration)} sec")
+
+    start = int(duration) // zoom_start
+    if len(title) > zoom_title_length_limit:
+        title = "... " + title[-zoom_title_length_limit:]
+    zoom = render(stft_db(samples, *zoom_size, start * sample_rate, (start + zoom_total) * sample_rate), sample_rate, start, zoom_total, title, f"{info}  |  {zoom_total} sec  |  starting @ {start} sec")
+
+    return [(f"{name}-full.png", full), (f"{name}-zoom.png", zoom)]
+
+def make_all(tracks, titles, workers=None):
+    '''
+    Renders the spectrograms of several tracks across a process pool, returns them in track order.
+    '''
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context) as executor:
+        return [image for images in executor.map(make_spectrograms, tracks, titles) for image in images]
@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+import utils
+
+#Pipeline stages in order
+stages = ["downloaded", "extracted", "torrent", "lac", "spectrograms", "metadata", "uploaded"]
+
+class StateStore:
+    '''
+    Records the Bandcamp URL of each release zip and its progress through the pipeline in SQLite.
+    Each completed stage is written as it finishes, so a restarted run resumes every release from its last checkpoint.
+    Also behaves as a {zip file name: URL} mapping, like the JSON cache it replaces,
+    and holds the queue of prepared releases waiting for review.
+    '''
+    def __init__(self, path=None):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS releases (file TEXT PRIMARY KEY, url TEXT, updated REAL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS checkpoints (file TEXT, stage TEXT, data TEXT, updated REAL, PRIMARY KEY (file, stage))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS queue (file TEXT PRIMARY KEY, status TEXT, prepared TEXT, report INTEGER, queued REAL)")
+        self.db.commit()
+
+    def __contains__(self, file):
+        return self.get_url(file) is not None
+
+    def __getitem__(self, file):
+        url = self.get_url(file)
+        if url is None:
+            raise KeyError(file)
+        return url
+
+    def __setitem__(self, file, url):
+        '''Records a downloaded release and its URL'''
+        self.set_url(file, url)
+        self.set(file, "downloaded", {"url": url})
+
+    def get_url(self, file):
+        with self.lock:
+            row = self.db.execute("SELECT url FROM releases WHERE file = ?", (file,)).fetchone()
+        return row[0] if row else None
+
+    def set_url(self, file, url):
+        with self.lock:
+            self.db.execute("REPLACE INTO releases VALUES (?, ?, ?)", (file, url, time.time()))
+            self.db.commit()
+
+    def get(self, file, stage):
+        '''Returns the data saved with a completed stage, or None if it hasn't completed'''
+        with self.lock:
+            row = self.db.execute("SELECT data FROM checkpoints WHERE file = ? AND stage = ?", (file, stage)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, file, stage, data=None):
+        '''Marks a stage completed with its JSON serializable data'''
+        with self.lock:
+            self.db.execute("REPLACE INTO checkpoints VALUES (?, ?, ?, ?)", (file, stage, json.dumps(data), time.time()))
+            self.db.commit()
+
+    def last_stage(self, file):
+        '''Returns the latest completed stage of a release, or None'''
+        with self.lock:
+            completed = {row[0] for row in self.db.execute("SELECT stage FROM checkpoints WHERE file = ?", (file,))}
+        return next((stage for stage in reversed(stages) if stage in completed), None)
+
+    def clear(self, file, keep=("downloaded", "uploaded")):
+        '''Forgets the checkpoints and queue entry of a release whose files have been removed'''
+        with self.lock:
+            self.db.execute(f"DELETE FROM checkpoints WHERE file = ? AND stage NOT IN ({', '.join('?' * len(keep))})", (file, *keep))
+            self.db.execute("DELETE FROM queue WHERE file = ?", (file,))
+            self.db.commit()
+
+    def enqueue(self, file, prepared):
+        '''Queues a prepared release for review'''
+        with self.lock:
+            self.db.execute("REPLACE INTO queue (file, status, prepared, report, queued) VALUES (?, 'pending', ?, 0, ?)", (file, json.dumps(prepared), time.time()))
+            self.db.commit()
+
+    def approve(self, file, prepared, report=False):
+        '''Marks a queued release approved for upload, saving any edits made during review'''
+        with self.lock:
+            self.db.execute("UPDATE queue SET status = 'approved', prepared = ?, report = ? WHERE file = ?", (json.dumps(prepared), int(report), file))
+            self.db.commit()
+
+    def dequeue(self, file):
+        with self.lock:
+            self.db.execute("DELETE FROM queue WHERE file = ?", (file,))
+            self.db.commit()
+
+    def queued(self, file):
+        '''Returns the status of a queued release, or None'''
+        with self.lock:
+            row = self.db.execute("SELECT status FROM queue WHERE file = ?", (file,)).fetchone()
+        return row[0] if row else None
+
+    def queued_releases(self, status):
+        '''Returns [(file, prepared, report)] of the queued releases with a status, oldest first'''
+        with self.lock:
+            rows = self.db.execute("SELECT file, prepared, report FROM queue WHERE status = ? ORDER BY queued", (status,)).fetchall()
+        return [(file, json.loads(prepared), bool(report)) for file, prepared, report in rows]
+
+    def migrate(self, cache_path):
+        '''Imports the URLs of a JSON cache file and renames it, returns the number imported'''
+        cache = utils.read_file(cache_path)
+        cache = json.loads(cache) if cache else {}
+        with self.lock:
+            self.db.executemany("INSERT OR IGNORE INTO releases VALUES (?, ?, ?)", [(file, url, time.time()) for file, url in cache.items()])
+            self.db.executemany("INSERT OR IGNORE INTO checkpoints VALUES (?, 'downloaded', ?, ?)", [(file, json.dumps({"url": url}), time.time()) for file, url in cache.items()])
+            self.db.commit()
+        os.rename(cache_path, cache_path + ".migrated")
+        return len(cache)
@@ -0,0 +1,104 @@
+import os
+import re
+import sys
+import json
+import shutil
+import logging
+import tempfile
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import download
+
+payload = bytes(range(256)) * 4096
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''Serves payload with Range support, cutting the connection mid-body while cuts remain'''
+    cuts = 0
+    ranges = []
+
+    def do_GET(self):
+        StandInHandler.ranges.append(self.headers.get('Range'))
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range') or '')
+        start = int(match.group(1)) if match else 0
+        if start >= len(payload):
+            self.send_response(416)
+            self.end_headers()
+            return
+
+        self.send_response(206 if match else 200)
+        self.send_header('Content-Disposition', 'attachment; filename="Artist - Album.zip"')
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(payload) - start))
+        if match:
+            self.send_header('Content-Range', f'bytes {start}-{len(payload) - 1}/{len(payload)}')
+        self.end_headers()
+
+        body = payload[start:]
+        if StandInHandler.cuts:
+            StandInHandler.cuts -= 1
+            body = body[:len(body) // 3]
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class DownloadTest(unittest.TestCase):
+    def setUp(self):
+        StandInHandler.cuts = 0
+        StandInHandler.ranges = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/download"
+        self.output_dir = tempfile.mkdtemp()
+        self.cache = {}
+        self.downloader = download.Downloader(self.output_dir, self.cache, logger=logging.getLogger(__name__))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.output_dir)
+
+    def read_download(self):
+        with open(os.path.join(self.output_dir, "Artist - Album.zip"), 'rb') as file:
+            return file.read()
+
+    def test_resumes_after_cut(self):
+        StandInHandler.cuts = 2
+        self.assertEqual(self.downloader.fetch("release", self.url), "Artist - Album.zip")
+        self.assertEqual(self.read_download(), payload)
+        self.assertEqual(len(StandInHandler.ranges), 3)
+        self.assertEqual(StandInHandler.ranges[0], None)
+        self.assertTrue(all(header.startswith("bytes=") for header in StandInHandler.ranges[1:]))
+        self.assertEqual(self.cache, {"Artist - Album.zip": "release"})
+        self.assertEqual(os.listdir(self.output_dir), ["Artist - Album.zip"])
+
+    def test_resumes_across_runs(self):
+        part_path = self.downloader._part_path(self.url)
+        with open(part_path, 'wb') as file:
+            file.write(payload[:1000])
+        with open(part_path + ".json", 'w') as file:
+            json.dump({"url": self.url, "file_name": "Artist - Album.zip", "etag": '"v1"', "length": len(payload)}, file)
+
+        self.assertEqual(self.downloader.fetch("release", self.url), "Artist - Album.zip")
+        self.assertEqual(self.read_download(), payload)
+        self.assertEqual(StandInHandler.ranges, ["bytes=1000-"])
+
+    def test_completes_finished_part(self):
+        part_path = self.downloader._part_path(self.url)
+        with open(part_path, 'wb') as file:
+            file.write(payload)
+        with open(part_path + ".json", 'w') as file:
+            json.dump({"url": self.url, "file_name": "Artist - Album.zip", "etag": '"v1"', "length": len(payload)}, file)
+
+        self.assertEqual(self.downloader.fetch("release", self.url), "Artist - Album.zip")
+        self.assertEqual(self.read_download(), payload)
+        self.assertEqual(StandInHandler.ranges, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ptpimg
+
+class FakePtpimgHandler(BaseHTTPRequestHandler):
+    '''Accepts uploads to /upload.php, failing while failures remain'''
+    failures = 0
+    uploads = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        if FakePtpimgHandler.failures:
+            FakePtpimgHandler.failures -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        FakePtpimgHandler.uploads += 1
+        body = json.dumps([{"code": f"image{FakePtpimgHandler.uploads}", "ext": "png"}]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class PtpimgTest(unittest.TestCase):
+    def setUp(self):
+        FakePtpimgHandler.failures = 0
+        FakePtpimgHandler.uploads = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakePtpimgHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.host = f"http://127.0.0.1:{self.server.server_port}"
+        self.dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.dir, "images")
+        sleep = mock.patch('ptpimg.time.sleep')
+        sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def make_uploader(self, retries=5):
+        return ptpimg.PtpimgUploader("key", self.cache_path, retries=retries, host=self.host)
+
+    def test_retries(self):
+        FakePtpimgHandler.failures = 2
+        self.assertEqual(self.make_uploader().upload("a.png", b"a"), f"{self.host}/image1.png")
+        self.assertEqual(FakePtpimgHandler.uploads, 1)
+
+    def test_gives_up(self):
+        FakePtpimgHandler.failures = 3
+        with self.assertRaises(ptpimg.UploadException):
+            self.make_uploader(retries=3).upload("a.png", b"a")
+
+    def test_dedup(self):
+        uploader = self.make_uploader()
+        urls = uploader.upload_images([("a.png", b"a"), ("b.png", b"b"), ("c.png", b"a")])
+        self.assertEqual(urls[0], urls[2])
+        self.assertEqual(FakePtpimgHandler.uploads, 2)
+
+        #A later run reuses the cached URLs
+        self.assertEqual(self.make_uploader().upload_images([("a.png", b"a"), ("b.png", b"b")]), urls[:2])
+        self.assertEqual(FakePtpimgHandler.uploads, 2)
+
+    def test_corrupt_cache(self):
+        with open(self.cache_path, 'w') as file:
+            file.write('{"abc": "http://')
+        uploader = self.make_uploader()
+        uploader.upload("a.png", b"a")
+        with open(self.cache_path) as file:
+            self.assertEqual(len(json.load(file)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
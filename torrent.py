@@ -0,0 +1,163 @@
+import os
+import mmap
+import time
+import json
+import bisect
+import hashlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+piece_lengths = [
+    (50 * 2**20, 15),
+    (150 * 2**20, 16),
+    (350 * 2**20, 17),
+    (512 * 2**20, 18),
+    (1024 * 2**20, 19),
+    (2048 * 2**20, 20),
+    (4096 * 2**20, 21),
+    (8192 * 2**20, 22),
+]
+
+def bencode(value):
+    '''
+    Returns the bencoded form of an int, str, bytes, list or dict.
+    '''
+    if isinstance(value, int):
+        return b'i%de' % value
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    if isinstance(value, bytes):
+        return b'%d:%s' % (len(value), value)
+    if isinstance(value, list):
+        return b'l' + b''.join(bencode(item) for item in value) + b'e'
+    if isinstance(value, dict):
+        items = sorted((key.encode('utf-8') if isinstance(key, str) else key, item) for key, item in value.items())
+        return b'd' + b''.join(bencode(key) + bencode(item) for key, item in items) + b'e'
+    raise TypeError(f"Can't bencode {type(value).__name__}")
+
+def pick_piece_length(total_size):
+    '''
+    Returns a piece length (as a power of 2) suited to a torrent of total_size bytes.
+    '''
+    for limit, exponent in piece_lengths:
+        if total_size <= limit:
+            return 2 ** exponent
+    return 2 ** 23
+
+def list_files(input_dir):
+    '''
+    Returns (relative path, absolute path, size, mtime) of every file in input_dir, in mktorrent order.
+    '''
+    files = []
+    for path, dirs, filenames in os.walk(input_dir):
+        for filename in filenames:
+            abs_path = os.path.join(path, filename)
+            stat = os.stat(abs_path)
+            files.append((os.path.relpath(abs_path, input_dir), abs_path, stat.st_size, stat.st_mtime_ns))
+    return sorted(files)
+
+def _hash_pieces(files, offsets, total_size, piece_length, start, end):
+    '''
+    Returns the SHA1 digests of pieces start to end of the concatenated files.
+    '''
+    digests = []
+    maps = {}
+    try:
+        pos = start * piece_length
+        index = bisect.bisect_right(offsets, pos) - 1
+        for piece in range(start, end):
+            sha = hashlib.sha1()
+            remaining = min(piece_length, total_size - pos)
+            while remaining:
+                path, offset, size = files[index]
+                file_pos = pos - offset
+                count = min(size - file_pos, remaining)
+                if path not in maps:
+                    with open(path, 'rb') as file:
+                        maps[path] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                with memoryview(maps[path])[file_pos:file_pos + count] as chunk:
+                    sha.update(chunk)
+                pos += count
+                remaining -= count
+                if pos >= offset + size:
+                    index += 1
+            digests.append(sha.digest())
+    finally:
+        for mapped in maps.values():
+            mapped.close()
+    return b''.join(digests)
+
+def hash_pieces(files, piece_length, workers=None):
+    '''
+    Hashes the pieces of a list of (path, size) files across a pool of threads.
+    '''
+    stream = []
+    offsets = []
+    total_size = 0
+    for path, size in files:
+        if size:
+            stream.append((path, total_size, size))
+            offsets.append(total_size)
+            total_size += size
+
+    piece_count = (total_size + piece_length - 1) // piece_length
+    workers = workers or os.cpu_count() or 1
+    batch = max(1, piece_count // (workers * 4))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = [executor.submit(_hash_pieces, stream, offsets, total_size, piece_length, start, min(start + batch, piece_count)) for start in range(0, piece_count, batch)]
+        return b''.join(result.result() for result in results)
+
+def _cache_key(files, piece_length):
+    key = json.dumps([piece_length, [(abs_path, size, mtime) for _, abs_path, size, mtime in files]])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def make_torrent(torrent, input_dir, announce, piece_length=None, source="RED", private=True, workers=None, cache_dir=None):
+    '''
+    Writes a torrent of input_dir to the torrent path, reusing cached piece hashes if the files haven't changed.
+    '''
+    files = list_files(input_dir)
+    if not piece_length:
+        piece_length = pick_piece_length(sum(size for _, _, size, _ in files))
+
+    pieces = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, _cache_key(files, piece_length))
+        if os.path.exists(cache_file):
+            with open(cache_file, 'rb') as file:
+                pieces = file.read()
+
+    if pieces is None:
+        pieces = hash_pieces([(abs_path, size) for _, abs_path, size, _ in files], piece_length, workers)
+        if cache_dir:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            with open(cache_file + ".tmp", 'wb') as file:
+                file.write(pieces)
+            os.replace(cache_file + ".tmp", cache_file)
+
+    info = {
+        'files': [{'length': size, 'path': rel_path.split(os.sep)} for rel_path, _, size, _ in files],
+        'name': os.path.basename(os.path.normpath(input_dir)),
+        'piece length': piece_length,
+        'pieces': pieces,
+    }
+    if private:
+        info['private'] = 1
+    if source:
+        info['source'] = source
+
+    metainfo = {
+        'announce': announce,
+        'created by': 'REDCamp',
+        'creation date': int(time.time()),
+        'info': info,
+    }
+
+    if os.path.dirname(torrent) and not os.path.exists(os.path.dirname(torrent)):
+        os.makedirs(os.path.dirname(torrent))
+    #Replace the file in one step, so a failed write never leaves a truncated torrent to be reused
+    with open(torrent + ".tmp", 'wb') as file:
+        file.write(bencode(metainfo))
+    os.replace(torrent + ".tmp", torrent)
+    return torrent
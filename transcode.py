@@ -1,10 +1,22 @@
 import re
 import os
 import shutil
+import tempfile
+import threading
+import contextlib
 import subprocess
 import mutagen.flac
 
-import ptpimg_uploader
+from concurrent.futures import ThreadPoolExecutor
+
+import spectrogram
+import torrent as torrent_builder
+
+from manifest import scan_release
+
+#Bytes of /dev/shm reserved by decodes in progress
+shm_lock = threading.Lock()
+shm_reserved = 0
 
 def ext_matcher(*extensions):
     '''
@@ -23,39 +35,92 @@ def locate(root, match_function, ignore_dotfiles=True):
             else:
                 yield filename
 
-def is_24bit(flac_dir):
+def is_24bit(flac_dir, manifest=None):
     '''
     Returns True if any FLAC within flac_dir is 24 bit.
     '''
+    if manifest:
+        return any(track['bits_per_sample'] > 16 for track in manifest['tracks'])
     flacs = (mutagen.flac.FLAC(flac_file) for flac_file in locate(flac_dir, ext_matcher('.flac')))
     return any(flac.info.bits_per_sample > 16 for flac in flacs)
 
-def make_torrent(torrent, input_dir, tracker, passkey, piece_length):
-    if not os.path.exists(os.path.dirname(torrent)):
-        os.makedirs(os.path.dirname(torrent))
+def make_torrent(torrent, input_dir, tracker, passkey, piece_length=None, cache_dir=None):
+    '''
+    Creates a RED torrent of input_dir. piece_length is a power of 2 exponent as with mktorrent -l, picked from the release size if not set.
+    '''
     tracker_url = '%(tracker)s%(passkey)s/announce' % {
         'tracker' : tracker,
         'passkey' : passkey,
     }
-    command = ["mktorrent", "-s", "RED", "-p", "-a", tracker_url, "-o", torrent, "-l", piece_length, input_dir]
-    subprocess.check_output(command, stderr=subprocess.STDOUT)
-    return torrent
-
-def is_lossless(flac_dir):
-    flac_file = next(locate(flac_dir, ext_matcher('.flac')))
-    wav_file = os.path.splitext(flac_file)[0] + ".wav"
-    subprocess.call(["ffmpeg", "-i", flac_file, wav_file], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    output = subprocess.check_output(["./LAC", wav_file]).decode()
-    result = re.search(r'Result: (\w+)', output).group(1)
-    os.remove(wav_file)
-    return result
-
-def make_spectrograms(flac_dir, api_key):
-    api = ptpimg_uploader.PtpimgUploader(api_key)
-    flac_file = next(locate(flac_dir, ext_matcher('.flac')))
-    subprocess.call(["./mkspectrograms.sh", flac_file], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    spectral_dir = os.path.join(flac_dir, "Spectrograms")
-    spectrals = locate(spectral_dir, ext_matcher('.png'))
-    links = api.upload_files(*spectrals)
-    shutil.rmtree(spectral_dir)
-    return links
\ No newline at end of file
+    piece_length = 2 ** int(piece_length) if piece_length else None
+    return torrent_builder.make_torrent(torrent, input_dir, tracker_url, piece_length, source="RED", private=True, cache_dir=cache_dir)
+
+@contextlib.contextmanager
+def decode_dir(track):
+    '''
+    Yields a tmpfs directory to decode track into if it fits alongside the decodes already there, otherwise the default temporary directory.
+    The space is reserved until the body finishes, as every release being prepared decodes at once.
+    '''
+    global shm_reserved
+    reserved = 0
+    if os.path.isdir("/dev/shm"):
+        wav_size = track.get('total_samples', 0) * track.get('channels', 2) * 4
+        with shm_lock:
+            if shm_reserved + wav_size * 2 < shutil.disk_usage("/dev/shm").free:
+                reserved = wav_size * 2
+                shm_reserved += reserved
+    try:
+        yield "/dev/shm" if reserved else None
+    finally:
+        if reserved:
+            with shm_lock:
+                shm_reserved -= reserved
+
+def lac_track(track):
+    '''
+    Decodes a FLAC to a temporary WAV outside the release directory and returns Lossless Audio Checker's result.
+    '''
+    with decode_dir(track) as dir, tempfile.TemporaryDirectory(prefix="redcamp_", dir=dir) as tmp_dir:
+        wav_file = os.path.join(tmp_dir, "track.wav")
+        subprocess.call(["ffmpeg", "-i", track['path'], wav_file], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        output = subprocess.check_output(["./LAC", wav_file]).decode()
+    return re.search(r'Result: (\w+)', output).group(1)
+
+def check_lossless(flac_dir, manifest=None, sample=0, workers=None):
+    '''
+    Runs Lossless Audio Checker on every FLAC in flac_dir, or an evenly spaced sample of them, in parallel.
+    Returns a dict of FLAC path to result.
+    '''
+    if manifest:
+        tracks = manifest['tracks']
+    else:
+        tracks = [{"path": flac_file} for flac_file in locate(flac_dir, ext_matcher('.flac'))]
+    if sample and sample < len(tracks):
+        tracks = [tracks[i * len(tracks) // sample] for i in range(sample)]
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        return dict(zip((track['path'] for track in tracks), executor.map(lac_track, tracks)))
+
+def is_lossless(flac_dir, manifest=None, sample=1, workers=None):
+    '''
+    Returns the first result from check_lossless that isn't Clean, or Clean.
+    '''
+    for result in check_lossless(flac_dir, manifest, sample, workers).values():
+        if result != "Clean":
+            return result
+    return "Clean"
+
+def make_spectrograms(flac_dir, uploader, manifest=None, all_tracks=False, workers=None):
+    '''
+    Renders the full and zoomed spectrograms of the first track, or every track, in memory and uploads them.
+    '''
+    if not manifest:
+        manifest = scan_release(flac_dir)
+    tracks = manifest['tracks'] if all_tracks else manifest['tracks'][:1]
+    titles = [os.path.basename(os.path.normpath(flac_dir)) + "/" + os.path.basename(track['path']) for track in tracks]
+
+    if len(tracks) > 1:
+        images = spectrogram.make_all(tracks, titles, workers)
+    else:
+        images = spectrogram.make_spectrograms(tracks[0], titles[0])
+    return uploader.upload_images(images)
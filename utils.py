@@ -1,8 +1,19 @@
+import io
 import re
 import os
+import shutil
 import unicodedata
 
+import mutagen
+import mutagen.flac
+
+import manifest
+
 from zipfile import ZipFile
+from concurrent.futures import ThreadPoolExecutor
+
+#Members larger than this are extracted on their own thread
+parallel_size = 8 * 2**20
 
 def read_file(path, mode='r'):
     if not os.path.exists(path):
@@ -22,8 +33,123 @@ def clean(value):
     value = re.sub(r'[<>:"\\|?*]', '', value).strip()
     return value
 
-def unzip_file(file, dir):
-        dir += "/" + os.path.basename(file).rstrip(".zip")
-        with ZipFile(file, 'r') as zf:
-            zf.extractall(dir)
-        return dir
\ No newline at end of file
+def normalize(value):
+    '''
+    Returns value folded for comparison: NFKC, no zero-width characters, case folded and single spaced.
+    '''
+    value = unicodedata.normalize('NFKC', value)
+    value = re.sub(r'[\u200b-\u200d\u2060\ufeff]', '', value)
+    return " ".join(value.casefold().split())
+
+def read_flac_header(fileobj):
+    '''
+    Returns the bytes of a FLAC stream up to the end of its metadata blocks, or None if it doesn't start with one.
+    '''
+    header = fileobj.read(4)
+    if header != b'fLaC':
+        return None
+    while True:
+        block = fileobj.read(4)
+        header += block
+        if len(block) < 4:
+            break
+        header += fileobj.read(int.from_bytes(block[1:4], 'big'))
+        if block[0] & 0x80:
+            break
+    return header
+
+def read_member_flac(zf, member):
+    '''
+    Reads the tags and stream info of a FLAC inside a zip without extracting the audio.
+    '''
+    with zf.open(member) as fileobj:
+        header = read_flac_header(fileobj)
+    if header is None:
+        with zf.open(member) as fileobj:
+            return mutagen.File(io.BytesIO(fileobj.read()))
+    return mutagen.flac.FLAC(io.BytesIO(header))
+
+def read_release_tags(file):
+    '''
+    Returns the artist and album tags of a release zip and the highest bit depth of its FLACs, without extracting it.
+    Returns None if the zip has no tagged FLACs.
+    '''
+    artist = None
+    album = None
+    bits_per_sample = 0
+    with ZipFile(file, 'r') as zf:
+        for member in zf.infolist():
+            if member.is_dir() or os.path.splitext(member.filename)[1] != ".flac":
+                continue
+            metadata = read_member_flac(zf, member)
+            if not artist and metadata.tags and 'artist' in metadata and 'album' in metadata:
+                artist = metadata['artist'][0]
+                album = metadata['album'][0]
+            bits_per_sample = max(bits_per_sample, metadata.info.bits_per_sample)
+    if not artist:
+        return None
+    return artist, album, bits_per_sample
+
+def member_path(name):
+    '''
+    Returns the parts of a zip member name with any absolute or parent directory parts removed.
+    '''
+    return [part for part in name.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+
+def _extract_member(file, member, target):
+    with ZipFile(file, 'r') as zf:
+        _copy_member(zf, member, target)
+
+def _copy_member(zf, member, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with zf.open(member) as src, open(target, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 2**20)
+
+def extract_release(file, dir, allowed_extensions, workers=4):
+    '''
+    Extracts the allowed files of a release zip into an "Artist - Album [FLAC]" directory in dir,
+    writing FLACs straight to "NN Title.flac" using the tags read from the zip.
+    Returns the release directory, album, artist and the release manifest.
+    '''
+    with ZipFile(file, 'r') as zf:
+        album = None
+        artist = None
+        members = []
+        for member in zf.infolist():
+            parts = member_path(member.filename)
+            if member.is_dir() or not parts:
+                continue
+            file_extension = os.path.splitext(parts[-1])[1]
+            if file_extension not in allowed_extensions:
+                continue
+            if file_extension == ".flac":
+                metadata = read_member_flac(zf, member)
+                if not album and not artist:
+                    album = metadata['album'][0]
+                    artist = metadata['artist'][0]
+                parts[-1] = metadata['tracknumber'][0].rjust(2, '0') + " " + clean(metadata['title'][0]) + ".flac"
+            else:
+                metadata = None
+            members.append((member, parts, metadata))
+
+        if album and artist:
+            release_dir = os.path.join(dir, clean(artist) + " - " + clean(album) + " [FLAC]")
+        else:
+            release_dir = os.path.join(dir, os.path.splitext(os.path.basename(file))[0])
+
+        #Extract small members here and large ones in parallel, each thread with its own handle
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = []
+            tracks = []
+            for member, parts, metadata in members:
+                target = os.path.join(release_dir, *parts)
+                if metadata:
+                    tracks.append(manifest.track_info(os.path.abspath(target), metadata, member.file_size))
+                if member.file_size >= parallel_size and workers > 1:
+                    results.append(executor.submit(_extract_member, file, member, target))
+                else:
+                    _copy_member(zf, member, target)
+            for result in results:
+                result.result()
+
+    return [release_dir, album, artist, manifest.make_manifest(release_dir, tracks)]
@@ -0,0 +1,92 @@
+import time
+import sqlite3
+import threading
+import requests
+
+from requests.adapters import HTTPAdapter
+
+headers = {
+    'User-Agent': 'REDCamp',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Encoding': 'gzip, deflate',
+    'Accept-Language': 'en-US,en;q=0.8'
+}
+
+class CachedSession:
+    '''
+    A pooled HTTP session with a persistent response cache. Fresh responses are served from the cache,
+    stale ones are revalidated with ETag/Last-Modified, and the least recently used are evicted past max_size bytes.
+    '''
+    def __init__(self, path=None, ttl=24 * 60 * 60, max_size=256 * 2**20, pool_size=8, timeout=30):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, body BLOB, etag TEXT, last_modified TEXT, fetched REAL, accessed REAL, size INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.db.commit()
+
+    def _lookup(self, url):
+        with self.lock:
+            return self.db.execute("SELECT body, etag, last_modified, fetched FROM responses WHERE url = ?", (url,)).fetchone()
+
+    def _store(self, url, body, etag, last_modified):
+        now = time.time()
+        with self.lock:
+            self.db.execute("REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)", (url, body, etag, last_modified, now, now, len(body)))
+            self._evict()
+            self.db.commit()
+
+    def _touch(self, url, revalidated=False):
+        now = time.time()
+        with self.lock:
+            if revalidated:
+                self.db.execute("UPDATE responses SET fetched = ?, accessed = ? WHERE url = ?", (now, now, url))
+            else:
+                self.db.execute("UPDATE responses SET accessed = ? WHERE url = ?", (now, url))
+            self.db.commit()
+
+    def _evict(self):
+        '''Deletes the least recently used responses until the cache fits in max_size'''
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        for url, size in self.db.execute("SELECT url, size FROM responses ORDER BY accessed").fetchall():
+            if total <= self.max_size:
+                break
+            self.db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total -= size
+
+    def get(self, url, ttl=None):
+        '''Returns the body of url, raising requests.HTTPError on error responses'''
+        return self.fetch(url, ttl)[0]
+
+    def fetch(self, url, ttl=None):
+        '''Returns (body, how it was served: "hit", "revalidated" or "miss") for url'''
+        ttl = self.ttl if ttl is None else ttl
+        cached = self._lookup(url)
+        if cached and time.time() - cached[3] < ttl:
+            self._touch(url)
+            return cached[0], "hit"
+
+        request_headers = {}
+        if cached and cached[1]:
+            request_headers['If-None-Match'] = cached[1]
+        if cached and cached[2]:
+            request_headers['If-Modified-Since'] = cached[2]
+
+        r = self.session.get(url, headers=request_headers, timeout=self.timeout)
+        if r.status_code == 304 and cached:
+            self._touch(url, revalidated=True)
+            return cached[0], "revalidated"
+        r.raise_for_status()
+
+        self._store(url, r.content, r.headers.get('ETag'), r.headers.get('Last-Modified'))
+        return r.content, "miss"